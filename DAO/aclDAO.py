@@ -0,0 +1,14 @@
+from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from DAO.base.baseDAO import BaseDAO
+from schemas.acl import CommandAcl
+
+
+class CommandAclDAO(BaseDAO[CommandAcl]):
+    def __init__(self):
+        super().__init__(CommandAcl)
+
+    async def list_all(self, db: AsyncSession) -> List[CommandAcl]:
+        result = await db.execute(select(CommandAcl))
+        return list(result.scalars().all())
@@ -0,0 +1,81 @@
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import select, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from DAO.base.baseDAO import BaseDAO
+from schemas.audit import CommandAudit
+
+
+class CommandAuditDAO(BaseDAO[CommandAudit]):
+    def __init__(self):
+        super().__init__(CommandAudit)
+
+    async def usage(
+            self,
+            db: AsyncSession,
+            since: Optional[datetime] = None,
+            until: Optional[datetime] = None,
+            command: Optional[str] = None,
+            user_id: Optional[int] = None,
+            group_id: Optional[int] = None
+    ) -> List[dict]:
+        """
+        按命令汇总调用次数与耗时，按调用次数从多到少排列
+        :param since: 起始时间（含）
+        :param until: 结束时间（不含）
+        :param command: 只统计该命令
+        :param user_id: 只统计该用户的调用
+        :param group_id: 只统计该群的调用
+        :return: [{command, calls, errors, users, avg_ms, max_ms}, ...]
+        """
+        conditions = []
+        if since is not None:
+            conditions.append(CommandAudit.created_at >= since)
+        if until is not None:
+            conditions.append(CommandAudit.created_at < until)
+        for column, value in ((CommandAudit.command, command), (CommandAudit.user_id, user_id),
+                              (CommandAudit.group_id, group_id)):
+            if value is not None:
+                conditions.append(column == value)
+        calls = func.count()
+        stmt = (
+            select(
+                CommandAudit.command,
+                calls.label("calls"),
+                func.sum(case((CommandAudit.outcome == "error", 1), else_=0)).label("errors"),
+                func.count(func.distinct(CommandAudit.user_id)).label("users"),
+                func.avg(CommandAudit.duration_ms).label("avg_ms"),
+                func.max(CommandAudit.duration_ms).label("max_ms"),
+            )
+            .where(*conditions)
+            .group_by(CommandAudit.command)
+            .order_by(calls.desc())
+        )
+        result = await db.execute(stmt)
+        return [dict(row._mapping) for row in result]
+
+    async def latency_percentiles(
+            self,
+            db: AsyncSession,
+            command: str,
+            since: Optional[datetime] = None,
+            quantiles: tuple[float, ...] = (0.5, 0.95, 0.99)
+    ) -> dict[float, float]:
+        """
+        单个命令的耗时分位数（毫秒），各数据库的分位数函数不通用，在数据库中排好序后按位置取值
+        :param command: 命令名
+        :param since: 起始时间（含）
+        :param quantiles: 要计算的分位点
+        """
+        conditions = [CommandAudit.command == command]
+        if since is not None:
+            conditions.append(CommandAudit.created_at >= since)
+        total = await db.scalar(select(func.count()).select_from(CommandAudit).where(*conditions))
+        if not total:
+            return {}
+        ordered = select(CommandAudit.duration_ms).where(*conditions).order_by(CommandAudit.duration_ms)
+        percentiles = {}
+        for q in quantiles:
+            position = min(total - 1, int(total * q))
+            percentiles[q] = await db.scalar(ordered.offset(position).limit(1))
+        return percentiles
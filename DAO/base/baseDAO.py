@@ -1,14 +1,176 @@
-from typing import Any, Type, TypeVar, Tuple, List, Generic, Coroutine, Optional
-from sqlalchemy import select, delete as sql_delete, update as sql_update, func
+from typing import Any, Type, TypeVar, Tuple, List, Generic, Coroutine, Optional, Sequence, Union, Iterator, AsyncIterator
+from sqlalchemy import select, insert as sql_insert, delete as sql_delete, update as sql_update, func, tuple_, bindparam
+from sqlalchemy.dialects import mysql, sqlite, postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.inspection import inspect
+from sqlalchemy.orm import make_transient_to_detached
 from sqlalchemy.exc import MultipleResultsFound
+from logger import logger, truncate
+from metrics import registry
+from DAO.base.cache import EntityCache
+from db.routing import use_primary
+import time
+from contextvars import ContextVar
+from functools import wraps
 ModelType = TypeVar("ModelType")
 
+# 批量操作时每条语句包含的最大行数，避免单条 SQL 过大
+DEFAULT_CHUNK_SIZE = 500
+
+DAO_DURATION = registry.histogram("hanerin_dao_duration_seconds", "DAO 调用耗时", ("model", "operation", "outcome"))
+DAO_ERRORS = registry.counter("hanerin_dao_errors_total", "DAO 调用失败（含已回滚）次数", ("model", "operation"))
+
+_CACHED_DAOS: List["BaseDAO"] = []
+
+# 当前 DAO 调用的状态，_failed 在此标记被吞掉的异常，instrumented 据此记录结果
+_call_failed: ContextVar[Optional[List[bool]]] = ContextVar("dao_call_failed", default=None)
+
+
+def _cache_stats():
+    stats = {}
+    for dao in _CACHED_DAOS:
+        for result, count in dao.cache.stats().items():
+            if result != "size":
+                stats[(dao.model.__name__, result)] = count
+    return stats
+
+
+registry.callback("hanerin_dao_cache_requests_total", "DAO 实体缓存命中/未命中次数", _cache_stats,
+                  labels=("model", "result"), type="counter")
+registry.callback("hanerin_dao_cache_entries", "DAO 实体缓存中的条目数",
+                  lambda: {(dao.model.__name__,): len(dao.cache) for dao in _CACHED_DAOS}, labels=("model",))
+
+
+def instrumented(operation: str):
+    """
+    统计 DAO 方法的耗时与结果
+    """
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            failed = [False]
+            token = _call_failed.set(failed)
+            try:
+                return await method(self, *args, **kwargs)
+            except BaseException:
+                failed[0] = True
+                raise
+            finally:
+                _call_failed.reset(token)
+                outcome = "error" if failed[0] else "success"
+                if failed[0]:
+                    DAO_ERRORS.inc(model=self.model.__name__, operation=operation)
+                DAO_DURATION.observe(time.perf_counter() - started,
+                                     model=self.model.__name__, operation=operation, outcome=outcome)
+        return wrapper
+    return decorator
+
 class BaseDAO(Generic[ModelType]):
-    def __init__(self, model: Type[ModelType]):
+    def __init__(self, model: Type[ModelType], cache: Optional[EntityCache] = None):
+        """
+        :param model: 模型类
+        :param cache: 可选的实体缓存，按主键和唯一列缓存 get 的结果，增删改时自动失效
+        """
         self.model = model
         self._primary_keys = inspect(model).primary_key
+        self._columns = tuple(attr.key for attr in inspect(model).column_attrs)
+        self._unique_columns = tuple(col.key for col in model.__table__.columns if col.unique)
+        self.cache = cache
+        # 按“语句种类 + 主键个数 + 过滤列（及其是否为 None）”缓存带绑定参数的语句模板
+        self._statements: dict[tuple, Any] = {}
+        if cache is not None:
+            cache.bind(self._unique_columns)
+            _CACHED_DAOS.append(self)
+
+    def _failed(self, operation: str, e: Exception, message: str):
+        # 被吞掉并回滚的异常也要能在日志和指标里看到：在 instrumented 中时由它按 error 记录本次调用
+        failed = _call_failed.get()
+        if failed is not None:
+            failed[0] = True
+        else:
+            DAO_ERRORS.inc(model=self.model.__name__, operation=operation)
+        # 只记录异常摘要，完整堆栈会带出 SQL 参数（如密码哈希）
+        logger.warning(f"{self.model.__name__} {message}，已回滚: {truncate(repr(e))}")
+
+    @staticmethod
+    def _dialect(db: AsyncSession):
+        return db.get_bind().dialect
+
+    @staticmethod
+    def _chunks(rows: Sequence, chunk_size: int) -> Iterator[Sequence]:
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+
+    def _to_values(self, rows: Sequence[Union[dict, ModelType]]) -> List[dict]:
+        """
+        把模型实例或字典统一转换为列值字典。多行 VALUES 要求每行的列相同，
+        模型实例只去掉值为 None 的自增主键
+        """
+        values = []
+        for row in rows:
+            if isinstance(row, dict):
+                values.append(row)
+                continue
+            if not isinstance(row, self.model):
+                raise TypeError(f"{row!r} 不是 {self.model.__name__} 实例")
+            item = {key: getattr(row, key) for key in self._columns}
+            for col in self._primary_keys:
+                if item.get(col.key) is None and col.autoincrement in (True, "auto"):
+                    item.pop(col.key, None)
+            values.append(item)
+        return values
+
+    def _pk_key(self, values: Sequence[Any]) -> tuple:
+        # 统一主键值的类型，保证 get(db, "1") 与 get(db, 1) 命中同一条缓存
+        key = []
+        for col, value in zip(self._primary_keys, values):
+            try:
+                python_type = col.type.python_type
+                key.append(value if value is None or isinstance(value, python_type) else python_type(value))
+            except (NotImplementedError, TypeError, ValueError):
+                key.append(value)
+        return tuple(key)
+
+    def _pk_of(self, obj: ModelType) -> tuple:
+        return tuple(getattr(obj, col.key) for col in self._primary_keys)
+
+    def _cache_lookup(self, primary_key_values: tuple, filters: dict) -> Optional[dict]:
+        if primary_key_values and not filters and len(primary_key_values) == len(self._primary_keys):
+            return self.cache.get(self._pk_key(primary_key_values))
+        if not primary_key_values and len(filters) == 1:
+            (column, value), = filters.items()
+            if column in self._unique_columns:
+                return self.cache.get_by_unique(column, value)
+        return None
+
+    async def _from_snapshot(self, db: AsyncSession, snapshot: dict) -> ModelType:
+        # 会话中已有该实体时直接返回它，不能用快照覆盖其中尚未提交的修改
+        identity_key = inspect(self.model).identity_key_from_primary_key(
+            [snapshot[col.key] for col in self._primary_keys])
+        existing = db.identity_map.get(identity_key)
+        if existing is not None:
+            return existing
+        # 否则用快照构造一个“已持久化、未修改”的实例并挂到当前会话，不产生查询
+        obj = self.model(**snapshot)
+        make_transient_to_detached(obj)
+        return await db.merge(obj, load=False)
+
+    def _cache_put(self, db: AsyncSession, obj: ModelType, version: int):
+        # 会话中尚未提交的修改不能进入缓存
+        if obj in db.dirty or obj in db.new:
+            return
+        self.cache.put(self._pk_of(obj), {key: getattr(obj, key) for key in self._columns}, version)
+
+    def _invalidate(self, obj: Optional[ModelType] = None):
+        if self.cache is None:
+            return
+        if obj is None:
+            self.cache.clear()
+        else:
+            # 优先取会话中的标识，提交后属性已失效时也不会触发加载
+            identity = inspect(obj).identity
+            self.cache.invalidate(self._pk_key(identity or self._pk_of(obj)))
 
     def _get_primary_key_names(self) -> Tuple[str, ...]:
         return tuple(col.name for col in self._primary_keys)
@@ -32,6 +194,56 @@ class BaseDAO(Generic[ModelType]):
             raise ValueError("未提供任何查询条件")
         return conditions
 
+    def _statement(self, kind: str, primary_key_values: tuple, filters: dict) -> Tuple[Any, dict]:
+        """
+        取出（首次则编译）该条件形状对应的语句模板，并组装本次调用的参数
+        同一形状的语句对象被复用，SQLAlchemy 的缓存键与编译结果也随之复用，每次调用只剩参数绑定
+        :param kind: 语句种类，见 _STATEMENT_BUILDERS
+        :return: (语句, 参数)
+        """
+        shape = (kind, len(primary_key_values),
+                 tuple(sorted((name, value is None) for name, value in filters.items())))
+        stmt = self._statements.get(shape)
+        if stmt is None:
+            stmt = self._STATEMENT_BUILDERS[kind](self.model, self._bound_conditions(shape[1], shape[2]))
+            self._statements[shape] = stmt
+        params = {f"pk_{i}": value for i, value in enumerate(primary_key_values)}
+        for name, value in filters.items():
+            if value is not None:
+                params[f"f_{name}"] = value
+        return stmt, params
+
+    def _bound_conditions(self, pk_count: int, filter_shape: tuple) -> list:
+        # 与 _build_conditions 的校验一致，只在编译模板时执行一次
+        conditions = []
+        if pk_count:
+            if pk_count != len(self._primary_keys):
+                raise ValueError(
+                    f"提供的主键值数量（{pk_count}）"
+                    f"与模型 {self.model.__name__} 的主键数量（{len(self._primary_keys)}）不匹配"
+                )
+            for i, col in enumerate(self._primary_keys):
+                conditions.append(col == bindparam(f"pk_{i}"))
+        for field_name, is_null in filter_shape:
+            if not hasattr(self.model, field_name):
+                raise AttributeError(f"模型 {self.model.__name__} 没有字段 '{field_name}'")
+            column = getattr(self.model, field_name)
+            # None 需要编译成 IS NULL，不能作为参数绑定
+            conditions.append(column.is_(None) if is_null else column == bindparam(f"f_{field_name}"))
+        if not conditions:
+            raise ValueError("未提供任何查询条件")
+        return conditions
+
+    _STATEMENT_BUILDERS = {
+        "get": lambda model, conditions: select(model).where(*conditions).limit(2),
+        "first": lambda model, conditions: select(model).where(*conditions).limit(1),
+        "select": lambda model, conditions: select(model).where(*conditions),
+        # 条件里是绑定参数，无法在 Python 侧求值来同步会话，改用 fetch 按 RETURNING 的主键同步
+        "delete_returning": lambda model, conditions: (sql_delete(model).where(*conditions).returning(model)
+                                                       .execution_options(synchronize_session="fetch")),
+    }
+
+    @instrumented("get")
     async def get(
             self,
             db: AsyncSession,
@@ -39,15 +251,78 @@ class BaseDAO(Generic[ModelType]):
             **filters: Any
     ) -> Optional[ModelType]:
         try:
-            conditions = self._build_conditions(*primary_key_values, **filters)
-            stmt = select(self.model).where(*conditions).limit(2)
-            result = await db.execute(stmt)
-            return result.scalars().one_or_none()
+            version = None
+            if self.cache is not None:
+                snapshot = self._cache_lookup(primary_key_values, filters)
+                if snapshot is not None:
+                    return await self._from_snapshot(db, snapshot)
+                version = self.cache.version
+            stmt, params = self._statement("get", primary_key_values, filters)
+            result = await db.execute(stmt, params)
+            obj = result.scalars().one_or_none()
+            if obj is not None and self.cache is not None:
+                self._cache_put(db, obj, version)
+            return obj
         except MultipleResultsFound:
             return None
         # 不捕获其他 Exception，让 bug 暴露出来（或按需处理）
 
+    def _filter_conditions(self, **filters: Any) -> list:
+        # 遍历类查询允许不带条件（即整张表）
+        return self._build_conditions(**filters) if filters else []
+
+    async def stream(
+            self,
+            db: AsyncSession,
+            batch_size: int = DEFAULT_CHUNK_SIZE,
+            **filters: Any
+    ) -> AsyncIterator[ModelType]:
+        """
+        按主键顺序逐行遍历满足条件的记录，底层使用服务端游标，每次只从数据库取 batch_size 行
+        用法: async for user in userDAO.stream(db, batch_size=200): ...
+        遍历期间会一直占用该会话的连接，循环体内不要在同一个会话上执行其他语句
+        :param batch_size: 每批从数据库读取的行数
+        :param filters: 等值过滤条件，不传则遍历整张表
+        """
+        stmt = (select(self.model).where(*self._filter_conditions(**filters))
+                .order_by(*self._primary_keys)
+                .execution_options(yield_per=batch_size))
+        result = await db.stream_scalars(stmt)
+        try:
+            async for obj in result:
+                yield obj
+        finally:
+            await result.close()
+
+    @instrumented("page")
+    async def page(
+            self,
+            db: AsyncSession,
+            after: Any = None,
+            limit: int = 100,
+            **filters: Any
+    ) -> List[ModelType]:
+        """
+        键集分页：按主键升序返回主键大于 after 的至多 limit 条记录，不使用 OFFSET，翻到多深都只扫描 limit 行
+        下一页把本页最后一条记录的主键作为 after 传入，返回空列表表示已经到底
+        :param after: 上一页最后一条记录的主键，复合主键时传元组；None 表示第一页
+        :param limit: 每页条数
+        :param filters: 等值过滤条件
+        """
+        conditions = self._filter_conditions(**filters)
+        if after is not None:
+            if len(self._primary_keys) == 1:
+                conditions.append(self._primary_keys[0] > after)
+            else:
+                if not isinstance(after, (tuple, list)) or len(after) != len(self._primary_keys):
+                    raise ValueError(f"模型 {self.model.__name__} 为复合主键，after 须为 {len(self._primary_keys)} 元组")
+                conditions.append(tuple_(*self._primary_keys) > tuple_(*after))
+        stmt = select(self.model).where(*conditions).order_by(*self._primary_keys).limit(limit)
+        result = await db.execute(stmt)
+        return list(result.scalars())
+
 
+    @instrumented("insert")
     async def insert(self, db: AsyncSession, obj: ModelType) -> Optional[ModelType]:
         """插入对象，成功返回实例（含数据库生成的字段如ID），失败返回 None"""
         try:
@@ -56,12 +331,15 @@ class BaseDAO(Generic[ModelType]):
             db.add(obj)
             await db.commit()
             await db.refresh(obj)  # 确保获取自增ID等
+            self._invalidate(obj)
             return obj
         except Exception as e:
+            self._failed("insert", e, "插入失败")
             await db.rollback()
             return None
 
 
+    @instrumented("update")
     async def update(self, db: AsyncSession, obj: ModelType) -> Optional[ModelType]:
         """更新对象，成功返回更新后的实例，失败返回 None"""
         try:
@@ -74,13 +352,16 @@ class BaseDAO(Generic[ModelType]):
                     return None
             db.add(obj)
             await db.commit()
+            self._invalidate(obj)
             await db.refresh(obj)
             return obj
-        except Exception:
+        except Exception as e:
+            self._failed("update", e, "更新失败")
             await db.rollback()
             return None
 
 
+    @instrumented("delete")
     async def delete(
             self,
             db: AsyncSession,
@@ -89,22 +370,25 @@ class BaseDAO(Generic[ModelType]):
     ) -> Optional[ModelType]:
         """删除单条记录，成功返回被删除的对象，失败返回 None"""
         try:
-            # 先查询
-            conditions = self._build_conditions(*primary_key_values, **filters)
-            stmt = select(self.model).where(*conditions).limit(1)
-            result = await db.execute(stmt)
+            # 先查询（读写分离时从主库查，保证删除的是最新的数据）
+            use_primary(db)
+            stmt, params = self._statement("first", primary_key_values, filters)
+            result = await db.execute(stmt, params)
             obj = result.scalar_one_or_none()
             if obj is None:
                 return None
             # 再删除
             await db.delete(obj)
             await db.commit()
+            self._invalidate(obj)
             return obj
-        except Exception:
+        except Exception as e:
+            self._failed("delete", e, "删除失败")
             await db.rollback()
             return None
 
 
+    @instrumented("delete_many")
     async def delete_many(
             self,
             db: AsyncSession,
@@ -113,19 +397,181 @@ class BaseDAO(Generic[ModelType]):
     ) -> Optional[List[ModelType]]:
         """批量删除，成功返回被删除的对象列表，失败返回 None"""
         try:
-            # 先查询所有匹配项
+            use_primary(db)
+            if self._dialect(db).delete_returning:
+                # 支持 RETURNING 时一条 DELETE 语句完成删除并取回对象
+                stmt, params = self._statement("delete_returning", primary_key_values, filters)
+                result = await db.execute(stmt, params)
+                objs = result.scalars().all()
+            else:
+                # 否则先查询再用一条 DELETE 语句删除，不再逐个对象删除
+                stmt, params = self._statement("select", primary_key_values, filters)
+                result = await db.execute(stmt, params)
+                objs = result.scalars().all()
+                if not objs:
+                    return []  # 没有匹配项，但操作成功 → 返回空列表（非 None）
+                # 按查到的主键删除，删除的正好是返回的这些对象
+                if len(self._primary_keys) == 1:
+                    condition = self._primary_keys[0].in_([self._pk_of(obj)[0] for obj in objs])
+                else:
+                    condition = tuple_(*self._primary_keys).in_([self._pk_of(obj) for obj in objs])
+                await db.execute(sql_delete(self.model).where(condition))
+            await db.commit()
+            for obj in objs:
+                self._invalidate(obj)
+            return list(objs)
+        except Exception as e:
+            self._failed("delete_many", e, "批量删除失败")
+            await db.rollback()
+            return None
+
+    @instrumented("delete_where")
+    async def delete_where(
+            self,
+            db: AsyncSession,
+            *primary_key_values: Any,
+            returning: bool = False,
+            **filters: Any
+    ) -> Optional[Union[int, List[dict]]]:
+        """
+        单条 DELETE 语句按条件删除
+        :param returning: 为 True 且数据库支持 RETURNING 时返回被删除的行
+        :return: 被删除的行数（或行数据），失败返回 None
+        """
+        try:
             conditions = self._build_conditions(*primary_key_values, **filters)
-            stmt = select(self.model).where(*conditions)
+            stmt = sql_delete(self.model).where(*conditions)
+            if returning and self._dialect(db).delete_returning:
+                result = await db.execute(stmt.returning(*self.model.__table__.columns))
+                rows = [dict(row._mapping) for row in result]
+                await db.commit()
+                self._invalidate()
+                return rows
             result = await db.execute(stmt)
-            objs = result.scalars().all()
-            if not objs:
-                return []  # 没有匹配项，但操作成功 → 返回空列表（非 None）
+            await db.commit()
+            self._invalidate()
+            return result.rowcount
+        except Exception as e:
+            self._failed("delete_where", e, "按条件删除失败")
+            await db.rollback()
+            return None
 
-            # 删除所有
-            for obj in objs:
-                await db.delete(obj)
+    @instrumented("update_where")
+    async def update_where(
+            self,
+            db: AsyncSession,
+            values: dict,
+            *primary_key_values: Any,
+            returning: bool = False,
+            **filters: Any
+    ) -> Optional[Union[int, List[dict]]]:
+        """
+        单条 UPDATE 语句按条件更新
+        :param values: 要更新的列及新值
+        :param returning: 为 True 且数据库支持 RETURNING 时返回更新后的行
+        :return: 受影响的行数（或行数据），失败返回 None
+        """
+        try:
+            conditions = self._build_conditions(*primary_key_values, **filters)
+            stmt = sql_update(self.model).where(*conditions).values(**values)
+            if returning and self._dialect(db).update_returning:
+                result = await db.execute(stmt.returning(*self.model.__table__.columns))
+                rows = [dict(row._mapping) for row in result]
+                await db.commit()
+                self._invalidate()
+                return rows
+            result = await db.execute(stmt)
             await db.commit()
-            return list(objs)
-        except Exception:
+            self._invalidate()
+            return result.rowcount
+        except Exception as e:
+            self._failed("update_where", e, "按条件更新失败")
+            await db.rollback()
+            return None
+
+    @instrumented("insert_many")
+    async def insert_many(
+            self,
+            db: AsyncSession,
+            rows: Sequence[Union[dict, ModelType]],
+            returning: bool = False,
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Optional[Union[int, List[dict]]]:
+        """
+        多行 VALUES 批量插入，每 chunk_size 行一条语句，所有分块在同一个事务中提交
+        :param rows: 模型实例或列值字典，每行的列必须相同
+        :param returning: 为 True 且数据库支持 RETURNING 时返回插入的行（含自增主键）
+        :return: 插入的行数（或行数据），失败返回 None
+        """
+        if not rows:
+            return [] if returning else 0
+        try:
+            use_returning = returning and self._dialect(db).insert_returning
+            inserted, count = [], 0
+            for chunk in self._chunks(self._to_values(rows), chunk_size):
+                stmt = sql_insert(self.model).values(list(chunk))
+                if use_returning:
+                    result = await db.execute(stmt.returning(*self.model.__table__.columns))
+                    inserted.extend(dict(row._mapping) for row in result)
+                else:
+                    result = await db.execute(stmt)
+                    count += result.rowcount
+            await db.commit()
+            return inserted if use_returning else count
+        except Exception as e:
+            self._failed("insert_many", e, "批量插入失败")
+            await db.rollback()
+            return None
+
+    @instrumented("upsert_many")
+    async def upsert_many(
+            self,
+            db: AsyncSession,
+            rows: Sequence[Union[dict, ModelType]],
+            conflict_columns: Optional[Sequence[str]] = None,
+            update_columns: Optional[Sequence[str]] = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Optional[int]:
+        """
+        批量插入或更新（MySQL: ON DUPLICATE KEY UPDATE；SQLite/PostgreSQL: ON CONFLICT DO UPDATE）
+        :param rows: 模型实例或列值字典，每行的列必须相同
+        :param conflict_columns: 判断冲突的唯一列，默认为主键（MySQL 由唯一索引自行判断，忽略此参数）
+        :param update_columns: 冲突时更新的列，默认为除冲突列以外传入的所有列
+        :return: 受影响的行数（各数据库的计数口径不同，MySQL 更新一行计为 2），失败返回 None
+        """
+        if not rows:
+            return 0
+        try:
+            values = self._to_values(rows)
+            conflict_columns = list(conflict_columns or self._get_primary_key_names())
+            if update_columns is None:
+                update_columns = [key for key in values[0] if key not in conflict_columns]
+            dialect = self._dialect(db).name
+            count = 0
+            for chunk in self._chunks(values, chunk_size):
+                if dialect in ("mysql", "mariadb"):
+                    stmt = mysql.insert(self.model).values(list(chunk))
+                    stmt = stmt.on_duplicate_key_update({col: stmt.inserted[col] for col in update_columns})
+                elif dialect in ("sqlite", "postgresql"):
+                    insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+                    stmt = insert(self.model).values(list(chunk))
+                    if update_columns:
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=conflict_columns,
+                            set_={col: stmt.excluded[col] for col in update_columns}
+                        )
+                    else:
+                        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+                else:
+                    raise NotImplementedError(f"数据库 {dialect} 不支持 upsert_many")
+                result = await db.execute(stmt)
+                count += result.rowcount
+            await db.commit()
+            self._invalidate()
+            return count
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            self._failed("upsert_many", e, "批量插入或更新失败")
             await db.rollback()
             return None
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Hashable
+
+
+class EntityCache:
+    """
+    DAO 的读穿透实体缓存，按主键存放行数据快照，唯一列（如 username）作为指向主键的二级索引。
+    条目有 TTL，总数超过上限时淘汰最久未使用的条目。
+    只缓存列值而不缓存 ORM 对象本身，命中时由 DAO 重新挂到当前会话上。
+    每次失效都会递增版本号，查询前取得的版本号在写入时已变化则放弃写入，
+    避免失效之前开始的读取在失效之后把旧数据写回缓存。
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        """
+        :param max_size: 最多缓存的实体数
+        :param ttl: 条目存活时间（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, dict]] = OrderedDict()  # 主键 -> (过期时间, 快照)
+        self._unique: dict[tuple[str, Any], Hashable] = {}  # (唯一列, 值) -> 主键
+        self._unique_columns: tuple[str, ...] = ()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def bind(self, unique_columns: tuple[str, ...]):
+        self._unique_columns = unique_columns
+
+    def get(self, pk: Hashable) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(pk)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, snapshot = entry
+            if expires < time.monotonic():
+                self._remove(pk)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(pk)
+            self.hits += 1
+            return snapshot
+
+    def get_by_unique(self, column: str, value: Any) -> Optional[dict]:
+        pk = self._unique.get((column, value))
+        if pk is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        snapshot = self.get(pk)
+        if snapshot is not None and snapshot.get(column) != value:
+            # 索引已过时（理论上不会发生，失效时会一并清理）
+            with self._lock:
+                self._unique.pop((column, value), None)
+                self.hits -= 1
+                self.misses += 1
+            return None
+        return snapshot
+
+    @property
+    def version(self) -> int:
+        """
+        当前版本号，查询数据库之前取得，写入缓存时传给 put
+        """
+        return self._version
+
+    def put(self, pk: Hashable, snapshot: dict, version: Optional[int] = None):
+        """
+        :param version: 查询前取得的版本号，此后发生过失效时不写入
+        """
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._remove(pk)
+            self._entries[pk] = (time.monotonic() + self.ttl, snapshot)
+            for column in self._unique_columns:
+                if snapshot.get(column) is not None:
+                    self._unique[(column, snapshot[column])] = pk
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, pk: Hashable):
+        with self._lock:
+            self._version += 1
+            self._remove(pk)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._unique.clear()
+
+    def _remove(self, pk: Hashable):
+        entry = self._entries.pop(pk, None)
+        if entry is None:
+            return
+        snapshot = entry[1]
+        for column in self._unique_columns:
+            key = (column, snapshot.get(column))
+            if self._unique.get(key) == pk:
+                del self._unique[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
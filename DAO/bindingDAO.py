@@ -0,0 +1,7 @@
+from DAO.base.baseDAO import BaseDAO
+from schemas.bindings import MaiBinding
+
+
+class MaiBindingDAO(BaseDAO[MaiBinding]):
+    def __init__(self):
+        super().__init__(MaiBinding)
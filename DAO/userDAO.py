@@ -1,7 +1,9 @@
 from DAO.base.baseDAO import BaseDAO
+from DAO.base.cache import EntityCache
 from schemas.users import User
 
 
 class UserDAO(BaseDAO[User]):
     def __init__(self):
-        super().__init__(User)
+        # 登录与鉴权每个请求都要按用户名/ID 查用户，缓存行快照以减少数据库往返
+        super().__init__(User, cache=EntityCache(max_size=1024, ttl=60))
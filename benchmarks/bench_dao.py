@@ -0,0 +1,79 @@
+"""
+BaseDAO 单行查询的基准：对比“每次调用都反射字段并新建 select 语句”与“按条件形状复用带绑定参数的语句模板”。
+使用内存 SQLite，数据库往返很便宜，测出的差距主要就是 Python 侧构造、缓存键计算与编译语句的开销。
+
+运行：python -m benchmarks.bench_dao
+"""
+import asyncio
+import os
+import time
+
+# 导入模型时 db.database 会按 database_url 创建默认引擎，基准不使用它，改为内存 SQLite，不需要安装 MySQL 驱动
+os.environ["database_url"] = "sqlite+aiosqlite://"
+os.environ["database_replica_url"] = ""
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from DAO.base.baseDAO import BaseDAO
+from db.database import Base
+from schemas.users import User
+
+USERS = 1000
+CALLS = 5000
+
+
+async def rebuilt_get(dao: BaseDAO, db, *primary_key_values, **filters):
+    # 语句缓存之前 get 的做法
+    conditions = dao._build_conditions(*primary_key_values, **filters)
+    result = await db.execute(select(dao.model).where(*conditions).limit(2))
+    return result.scalars().one_or_none()
+
+
+async def cached_get(dao: BaseDAO, db, *primary_key_values, **filters):
+    stmt, params = dao._statement("get", primary_key_values, filters)
+    result = await db.execute(stmt, params)
+    return result.scalars().one_or_none()
+
+
+def build_only(dao: BaseDAO, cached: bool) -> float:
+    started = time.perf_counter()
+    for i in range(CALLS):
+        if cached:
+            dao._statement("get", (), {"username": f"user{i % USERS}"})
+        else:
+            select(dao.model).where(*dao._build_conditions(username=f"user{i % USERS}")).limit(2)
+    return time.perf_counter() - started
+
+
+async def run(name: str, getter, dao: BaseDAO, session_factory):
+    for label, call in (("主键", lambda db, i: getter(dao, db, i % USERS + 1)),
+                        ("用户名", lambda db, i: getter(dao, db, username=f"user{i % USERS}"))):
+        async with session_factory() as db:
+            await call(db, 0)  # 预热
+            started = time.perf_counter()
+            for i in range(CALLS):
+                assert await call(db, i) is not None
+                db.expunge_all()
+            elapsed = time.perf_counter() - started
+        print(f"{name:<8} 按{label:<4} {CALLS / elapsed:8.0f} 次/秒  {elapsed / CALLS * 1e6:7.1f}us/次")
+
+
+async def main():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    dao = BaseDAO(User)
+    async with session_factory() as db:
+        await dao.insert_many(db, [{"username": f"user{i}", "hashed_password": "x"} for i in range(USERS)])
+
+    print(f"只构造语句 {CALLS} 次: 每次新建 {build_only(dao, False) * 1e3:.1f}ms, "
+          f"复用模板 {build_only(dao, True) * 1e3:.1f}ms")
+    await run("每次新建", rebuilt_get, dao, session_factory)
+    await run("复用模板", cached_get, dao, session_factory)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+数据层负载基准：多个并发会话同时调用 BaseDAO 的 get / insert / update / delete_many，
+统计每种操作的吞吐、失败数与延迟分位数，用于本地发现数据层的性能回退。
+使用不带实体缓存的 BaseDAO(User)，每次 get 都真正访问数据库，测的是数据库与连接池本身。
+默认在临时目录中新建 SQLite 文件库，也可以用 --url 指向任意数据库（会先执行迁移，并写入测试数据）。
+
+运行：python -m benchmarks.bench_dao_load [--url sqlite+aiosqlite:///bench.db] [--concurrency 8] [--ops 500]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+# 导入模型时 db.database 会按 database_url 创建默认引擎（未设置时为 MySQL，需要 aiomysql）。
+# 基准只使用下面 build_engine 创建的引擎，默认引擎改为不会被连接的内存 SQLite，不需要安装 MySQL 驱动
+os.environ["database_url"] = "sqlite+aiosqlite://"
+os.environ["database_replica_url"] = ""
+
+from DAO.base.baseDAO import BaseDAO
+from db.database import build_engine
+from db.migrate import migrate
+from schemas.users import User
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+OPERATIONS = ("get", "insert", "update", "delete_many")
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def worker(index: int, session_factory, dao: BaseDAO, ops: int, latencies: dict[str, list[float]],
+                 failures: dict[str, int]):
+    rng = random.Random(index)
+    prefix = f"bench-{index}-{uuid.uuid4().hex[:6]}"
+    created: list[int] = []
+    async with session_factory() as db:
+        for i in range(ops):
+            # 插入占四成，保证 get/update/delete_many 有数据可用
+            op = "insert" if not created or rng.random() < 0.4 else rng.choice(("get", "update", "delete_many"))
+            started = time.perf_counter()
+            # BaseDAO 出错时回滚并返回 None（如 SQLite 写锁竞争），记为失败，不计入延迟
+            ok = True
+            if op == "insert":
+                user = await dao.insert(db, User(username=f"{prefix}-{i}", hashed_password="x" * 60,
+                                                 qq=rng.randrange(10 ** 9), roles="user", buttons=""))
+                ok = user is not None
+                if ok:
+                    created.append(user.user_id)
+            elif op == "get":
+                ok = await dao.get(db, rng.choice(created)) is not None
+            elif op == "update":
+                user = await dao.get(db, rng.choice(created))
+                if user is None:
+                    ok = False
+                else:
+                    user.email = f"{i}@bench"
+                    ok = await dao.update(db, user) is not None
+            else:
+                user_id = rng.choice(created)
+                deleted = await dao.delete_many(db, user_id)
+                ok = bool(deleted)
+                if deleted is not None:
+                    created.remove(user_id)
+            if ok:
+                latencies[op].append(time.perf_counter() - started)
+            else:
+                failures[op] += 1
+            db.expunge_all()
+
+
+async def main(url: str, concurrency: int, ops: int):
+    engine = build_engine(url, "bench")
+    await migrate(engine)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+    dao = BaseDAO(User)
+    latencies = {op: [] for op in OPERATIONS}
+    failures = {op: 0 for op in OPERATIONS}
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i, session_factory, dao, ops, latencies, failures) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+
+    print(f"{engine.url.get_backend_name()}  并发会话 {concurrency}  每会话 {ops} 次操作  "
+          f"总计 {concurrency * ops / elapsed:.0f} 次/秒")
+    print(f"{'操作':<12}{'次数':>8}{'失败':>8}{'次/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"
+          f"{'max(ms)':>10}")
+    for op in OPERATIONS:
+        samples = latencies[op]
+        if not samples:
+            if failures[op]:
+                print(f"{op:<12}{0:>8}{failures[op]:>8}")
+            continue
+        print(f"{op:<12}{len(samples):>8}{failures[op]:>8}{len(samples) / elapsed:>10.0f}"
+              f"{statistics.median(samples) * 1e3:>10.2f}{percentile(samples, 0.95) * 1e3:>10.2f}"
+              f"{percentile(samples, 0.99) * 1e3:>10.2f}{max(samples) * 1e3:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="数据层并发负载基准")
+    parser.add_argument("--url", help="数据库 URL，默认为临时 SQLite 文件库")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发会话数")
+    parser.add_argument("--ops", type=int, default=500, help="每个会话的操作次数")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(main(args.url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}",
+                         args.concurrency, args.ops))
@@ -0,0 +1,136 @@
+"""
+命令分发开销的微基准：对比旧的两次 shlex 分词 + 每次 inspect.signature 绑定参数，
+与注册时编译好的前缀树路由 + 参数绑定器。
+
+运行：python -m benchmarks.bench_dispatch（需要 Python 3.12+，utils.MessageTypes 使用了 type 语句）
+"""
+import inspect
+import shlex
+import timeit
+from typing import Optional, Tuple
+
+from bot.router import CommandRouter
+from utils.MessageTypes import AtMessageSegment, TextMessageSegment, Message
+from utils.utils import CommandBinder, TooManyArgsError, InvalidArgsValueError, MissingArgsError
+
+ROUNDS = 20000
+
+
+async def mc(command: str, content: str = "", **kwargs):
+    pass
+
+
+async def hello(name: str = "", **kwargs):
+    pass
+
+
+async def qrcode(qr_code_content=None, **kwargs):
+    pass
+
+
+HANDLERS = {"/mc": mc, "/hello": hello, "/qrcode": qrcode}
+
+
+# ---------- 旧实现（仅用于对比） ----------
+
+def legacy_parse_command(message: Message, strip_slash: bool) -> Tuple[Optional[str], list[str]]:
+    try:
+        for segment in message:
+            if not isinstance(segment, TextMessageSegment):
+                continue
+            raw = segment.data.text.strip()
+            if strip_slash:
+                raw = raw.lstrip('/')
+            if not raw:
+                continue
+            tokens = shlex.split(raw)
+            if not tokens:
+                return None, []
+            return (f"/{tokens[0]}" if strip_slash else tokens[0]), tokens[1:]
+        return None, []
+    except ValueError:
+        return None, []
+
+
+def legacy_bind_args(func, arg_list: list[str]) -> dict:
+    sig = inspect.signature(func)
+    params = list(sig.parameters.values())
+    positional_params = [p for p in params if p.kind in (
+        inspect.Parameter.POSITIONAL_ONLY,
+        inspect.Parameter.POSITIONAL_OR_KEYWORD
+    )]
+    if len(arg_list) > len(positional_params):
+        raise TooManyArgsError("Too many arguments")
+    args = {}
+    for i, arg in enumerate(arg_list):
+        param = positional_params[i]
+        ann = param.annotation
+        try:
+            args[param.name] = arg if ann is inspect.Parameter.empty else ann(arg)
+        except Exception:
+            raise InvalidArgsValueError(f"Invalid value for `{param.name}`: {arg}")
+    for param in positional_params[len(arg_list):]:
+        if param.default is inspect.Parameter.empty:
+            raise MissingArgsError(f"Missing argument: `{param.name}`")
+        args[param.name] = param.default
+    return args
+
+
+def legacy_dispatch(message: Message):
+    command, arg_list = legacy_parse_command(message, strip_slash=True)
+    func = HANDLERS.get(command)
+    if func is None:
+        command, arg_list = legacy_parse_command(message, strip_slash=False)
+        if command is not None and command.startswith("SGWCMAID"):
+            func, arg_list = HANDLERS["/qrcode"], [command] + arg_list
+        else:
+            func = HANDLERS.get(command)
+        if func is None:
+            return None
+    return legacy_bind_args(func, arg_list)
+
+
+# ---------- 新实现 ----------
+
+router = CommandRouter()
+binders = {}
+for key, handler in HANDLERS.items():
+    router.add(key, key)
+    binders[key] = CommandBinder(handler)
+router.add_prefix("SGWCMAID", "/qrcode")
+
+
+def compiled_dispatch(message: Message):
+    matched = router.match(message)
+    if matched is None:
+        return None
+    return binders[matched.command].bind(matched.args)
+
+
+def _message(text: str) -> Message:
+    return [
+        AtMessageSegment(type="at", data={"qq": 10000}),
+        TextMessageSegment(type="text", data={"text": f" {text}"}),
+    ]
+
+
+CASES = {
+    "闲聊": _message("今天晚上谁来打舞萌 \"拼机\" 啊"),
+    "命令": _message("/mc lp \"say hello\""),
+    "二维码": _message("SGWCMAID2504190427ABCDEF"),
+    # 群聊里常见的全角空格不是 shlex 的分隔符，旧实现不会把它当成命令
+    "全角空格": _message("/hello\u3000Bob"),
+}
+
+
+def main():
+    for name, message in CASES.items():
+        assert legacy_dispatch(message) == compiled_dispatch(message), name
+        before = timeit.timeit(lambda: legacy_dispatch(message), number=ROUNDS)
+        after = timeit.timeit(lambda: compiled_dispatch(message), number=ROUNDS)
+        print(f"{name:<6} 旧: {before / ROUNDS * 1e6:7.2f}us/条  新: {after / ROUNDS * 1e6:7.2f}us/条  "
+              f"加速 {before / after:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
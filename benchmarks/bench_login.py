@@ -0,0 +1,68 @@
+"""
+登录吞吐基准：模拟登录高峰时 bcrypt 校验对事件循环的影响。
+同时发起若干并发登录校验，并在同一个事件循环上运行一个每 10ms 醒来一次的“聊天消息分发”任务，
+对比在事件循环上直接校验与放入有界线程池校验时的登录吞吐、被拒绝数与事件循环的最大卡顿。
+
+运行：python -m benchmarks.bench_login [--logins 64] [--rounds 10]
+"""
+import argparse
+import asyncio
+import time
+
+from utils.passwords import PasswordHasher, PasswordHasherBusy, _pre_hash
+from passlib.hash import bcrypt
+
+
+async def ticker(stop: asyncio.Event, lags: list[float]):
+    # 模拟聊天消息分发：记录每次醒来比预期晚了多少
+    while not stop.is_set():
+        expected = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - expected)
+
+
+async def run(name: str, verify, logins: int):
+    stop = asyncio.Event()
+    lags: list[float] = []
+    tick = asyncio.create_task(ticker(stop, lags))
+    await asyncio.sleep(0.05)
+
+    rejected = 0
+    started = time.perf_counter()
+
+    async def attempt():
+        nonlocal rejected
+        try:
+            assert await verify()
+        except PasswordHasherBusy:
+            rejected += 1
+
+    await asyncio.gather(*(attempt() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    accepted = logins - rejected
+    print(f"{name:<16} 登录 {accepted / elapsed:7.1f} 次/秒  拒绝 {rejected:>3}  "
+          f"总耗时 {elapsed:6.2f}s  事件循环最大卡顿 {max(lags) * 1e3:8.1f}ms  醒来次数 {len(lags)}")
+
+
+async def main(logins: int, rounds: int):
+    hashed = bcrypt.using(rounds=rounds).hash(_pre_hash("password"))
+
+    async def blocking():
+        # 旧实现：直接在事件循环上计算
+        return bcrypt.verify(_pre_hash("password"), hashed)
+
+    await run("事件循环上直接校验", blocking, logins)
+    for workers, waiting in ((2, 16), (4, logins)):
+        hasher = PasswordHasher(rounds=rounds, max_workers=workers, max_waiting=waiting)
+        await run(f"线程池 {workers} 排队 {waiting}", lambda: hasher.verify("password", hashed), logins)
+        hasher.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="登录吞吐基准")
+    parser.add_argument("--logins", type=int, default=64, help="并发登录数")
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt cost")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.rounds))
@@ -0,0 +1,107 @@
+"""
+/qq/ webhook 事件处理吞吐的基准：回放一段模拟的 OneBot 事件流，
+对比“每个事件都完整校验为 Event”与“先粗筛、只完整校验会被分发的事件”。
+两条路径做同样的判断（消息类型、是否 at 机器人、命令前缀树匹配），最后留下的事件也必须相同。
+
+运行：python -m benchmarks.bench_prefilter（需要 Python 3.12+，utils.MessageTypes 使用了 type 语句）
+"""
+import json
+import random
+import time
+
+from pydantic import TypeAdapter
+
+from bot.prefilter import peek_event, loads
+from bot.router import CommandRouter
+from utils.MessageTypes import Event, AtMessageSegment
+
+SELF_QQ = 10000
+EVENTS = 20000
+EVENT_ADAPTER = TypeAdapter(Event)
+
+router = CommandRouter()
+for key in ["/mc", "/hello", "/help", "/qrcode", "/mai", "/register"]:
+    router.add(key, key)
+router.add_prefix("SGWCMAID", "/qrcode")
+
+
+def _message_event(segments: list[dict], message_id: int) -> dict:
+    return {
+        "time": 1764000000, "self_id": SELF_QQ, "post_type": "message", "message_type": "group",
+        "sub_type": "normal", "message_id": message_id, "user_id": 123456, "group_id": 654321,
+        "message": segments, "raw_message": "...", "font": 0,
+        "sender": {"user_id": 123456, "nickname": "player", "sex": "unknown", "age": 0},
+    }
+
+
+def _text(text: str) -> dict:
+    return {"type": "text", "data": {"text": text}}
+
+
+def _at(qq: int) -> dict:
+    return {"type": "at", "data": {"qq": qq}}
+
+
+def build_stream(count: int) -> list[bytes]:
+    """
+    模拟群聊流量：心跳 30%，未 at 机器人的闲聊 60%，at 机器人的闲聊 7%，命令 3%
+    """
+    rng = random.Random(42)
+    stream = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.3:
+            event = {"time": 1764000000, "self_id": SELF_QQ, "post_type": "meta_event",
+                     "meta_event_type": "heartbeat", "status": {"online": True, "good": True}, "interval": 30000}
+        elif roll < 0.9:
+            event = _message_event([_text("今晚谁来打舞萌"), _at(222), _text(" 来不来")], i)
+        elif roll < 0.97:
+            event = _message_event([_at(SELF_QQ), _text(" 早上好")], i)
+        else:
+            event = _message_event([_at(SELF_QQ), _text(" /mc lp \"say hi\"")], i)
+        stream.append(json.dumps(event, ensure_ascii=False).encode())
+    return stream
+
+
+def full_validation(body: bytes):
+    # 粗筛之前的做法：先完整校验，再在模型上判断是否 at 机器人、是否命中命令
+    event = EVENT_ADAPTER.validate_json(body)
+    if getattr(event, "post_type", None) != "message" or event.sub_type != "normal":
+        return None
+    message = event.message
+    if not isinstance(message, list) or not message:
+        return None
+    first = message[0]
+    if not isinstance(first, AtMessageSegment) or first.data.qq != SELF_QQ:
+        return None
+    if router.match(message) is None:
+        return None
+    return event
+
+
+def prefiltered(body: bytes):
+    data = loads(body)
+    peeked = peek_event(data, SELF_QQ)
+    if peeked.reject is not None or router.match_text(peeked.text) is None:
+        return None
+    return EVENT_ADAPTER.validate_python(data)
+
+
+def run(name: str, handler, stream: list[bytes]) -> int:
+    started = time.perf_counter()
+    survivors = sum(handler(body) is not None for body in stream)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<8} {len(stream) / elapsed:10.0f} 事件/秒  {elapsed / len(stream) * 1e6:6.2f}us/事件  "
+          f"进入后续处理: {survivors}")
+    return survivors
+
+
+def main():
+    stream = build_stream(EVENTS)
+    before = run("完整校验", full_validation, stream)
+    after = run("先粗筛", prefiltered, stream)
+    assert before == after, "两条路径留下的事件数不同"
+
+
+if __name__ == "__main__":
+    main()
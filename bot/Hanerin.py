@@ -1,16 +1,31 @@
 from dotenv import load_dotenv
-from sqlmodel import SQLModel, Session, create_engine, select
 from utils.MessagePayloads import *
-from schemas.users import User
-from logger import logger
+from schemas.bindings import MaiBinding
+from logger import logger, truncate, request_id_var
+from metrics import registry, track_http
 from utils.MessageTypes import *
+from bot.router import CommandRouter, CommandMatch
+from bot.access import AccessRule
+from utils.utils import CommandBinder
+from bot.command import CommandSpec
+from bot.jobs import ReplyJobQueue
+from bot.executor import CommandExecutor, ExecutionPolicy
+from bot.audit import CommandAuditLog
+from bot.ratelimit import RateLimiter, RecentEvents, Rate
+from DAO.aclDAO import CommandAclDAO
+from DAO.bindingDAO import MaiBindingDAO
+from db.database import AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
 from mai_apis.SDGB.API_AimeDB import implGetUID
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from mai_apis.SDGB.update_sy import get_user_music
 import requests
 import asyncio
+import random
+import time
+from contextlib import contextmanager
 from functools import wraps
-from typing import Union, List, Callable, Any
+from typing import Union, List, Callable, Any, Optional
 from loguru import logger
 import os
 
@@ -25,47 +40,142 @@ def _int_to_bytes(n: int) -> bytes:
     return n.to_bytes(length, byteorder="big")
 
 
+COMMAND_DURATION = registry.histogram("hanerin_command_duration_seconds", "命令处理耗时", ("command", "outcome"))
+COMMAND_ERRORS = registry.counter("hanerin_command_errors_total", "命令处理异常次数", ("command",))
+COMMANDS_IN_FLIGHT = registry.gauge("hanerin_commands_in_flight", "正在执行的命令数", ("command",))
+
+
+@contextmanager
+def _track_command(name: str, audit: CommandAuditLog, event: Optional[MessageEvent]):
+    COMMANDS_IN_FLIGHT.inc(command=name)
+    started = time.perf_counter()
+    outcome = "success"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        COMMAND_ERRORS.inc(command=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        COMMANDS_IN_FLIGHT.dec(command=name)
+        COMMAND_DURATION.observe(elapsed, command=name, outcome=outcome)
+        audit.record(name, getattr(event, "user_id", None), getattr(event, "group_id", None), outcome, elapsed)
+
+
+def _call_logger(func: Callable, kwargs: dict, sample_rate: float):
+    """
+    按采样率记录命令调用，未被采样时返回 None。日志内容惰性求值，并截断过长的入参
+    """
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return None
+    event: MessageEvent = kwargs.get("event")
+    log = logger.bind(command=func.__name__, user_id=getattr(event, "user_id", None),
+                      group_id=getattr(event, "group_id", None), message_id=getattr(event, "message_id", None))
+    log.opt(lazy=True).info(
+        "[调用] {} 触发用户:{}, 入参: {}",
+        lambda: func.__name__,
+        lambda: getattr(event, "user_id", None),
+        lambda: truncate({key: value for key, value in kwargs.items() if key != "event"}),
+    )
+    return log
+
+
+def _reply_text(result: Optional[FastReplyPayload]) -> str:
+    if result is None:
+        return ""
+    if isinstance(result.reply, str):
+        return truncate(result.reply)
+    return truncate(" ".join(item.data.text for item in result.reply if isinstance(item, TextMessageSegment)))
+
+
+def _log_result(log, func: Callable, result: Optional[FastReplyPayload]):
+    if log is None:
+        return
+    log.opt(lazy=True).info("[调用] {} 返回消息: {}", lambda: func.__name__, lambda: _reply_text(result))
+
+
 class Hanerin:
     def __init__(self, qq):
         self.url = "http://127.0.0.1:30001"
-        self.command_map = {} # 0: command, 1: access list
+        self.command_map: dict[str, CommandSpec] = {}
+        self.access_specs = {} # 装饰器中声明的权限，数据库中的覆盖项在其基础上叠加
+        self.router = CommandRouter()
+        self.acl_dao = CommandAclDAO()
+        self.jobs = ReplyJobQueue(self.url)
+        self.executor = CommandExecutor()
+        self.rate_limiter = RateLimiter()
+        self.recent_events = RecentEvents()
+        self.audit = CommandAuditLog()
+        registry.callback("hanerin_reply_queue_depth", "延迟回复队列中等待的任务数", lambda: self.jobs.depth)
+        registry.callback("hanerin_dispatch_rejections_total", "被限流或去重丢弃的消息数",
+                          lambda: {(reason,): count for reason, count in self.stats().items()},
+                          labels=("reason",), type="counter")
         self.qq = qq
-        self.engine = create_engine('sqlite:////mnt/aleafy_cloud/aleafy/Hanerin/hanerin.sqlite')
         self.df = self.Divingfish()
-        self.mai2 = self.Mai2(self.engine)
+        self.mai2 = self.Mai2()
         return
 
     def has_access(self, command, user_id=None, group_id=None):
-        access = self.command_map[command][1]
-        if access['all']:
-            return True
-        assert (user_id or group_id)
-        in_groups = access["groups"] == "all" or group_id in access["groups"] if group_id else False
-        in_users = access["users"] == "all" or user_id in access["users"] if user_id else False
-        if user_id and group_id:
-            return in_users or in_groups
-        elif group_id:
-            return in_groups
-        else:
-            return in_users
-
-    def command(self, keys: Union[str, List[str]], users: Union[List[int], str] = [], groups: Union[List[int], str] = []):
+        return self.command_map[command].access.allows(user_id, group_id)
+
+    async def reload_access(self, db: AsyncSession):
+        """
+        从数据库重新加载权限覆盖项，重新编译所有命令的权限规则后整体替换，无需重启
+        :param db: 数据库会话
+        """
+        overrides = {}
+        for row in await self.acl_dao.list_all(db):
+            lists = overrides.setdefault(row.command, {"users": [], "groups": [], "deny_users": [], "deny_groups": []})
+            kind = "users" if row.target_type == "user" else "groups"
+            lists[kind if row.allow else f"deny_{kind}"].append(row.target_id)
+
+        compiled = {}
+        for key, base_rule in self.access_specs.items():
+            compiled[key] = base_rule.merge(**overrides[key]) if key in overrides else base_rule
+        for key, rule in compiled.items():
+            self.command_map[key].access = rule
+        logger.info(f"权限规则已重新加载, 数据库覆盖项涉及 {len(overrides)} 个命令")
+
+    def command(self, keys: Union[str, List[str]], users: Union[List[int], str] = [], groups: Union[List[int], str] = [],
+                prefixes: Union[str, List[str]] = [], deny_users: List[int] = [], deny_groups: List[int] = [],
+                deferred: bool = False, executor: Optional[str] = None, concurrency: Optional[int] = None,
+                user_rate: Optional[Rate] = None, group_rate: Optional[Rate] = None,
+                command_rate: Optional[Rate] = None, dedupe: bool = True, log_sample_rate: float = 1.0):
+        """
+        注册命令
+        :param keys: 触发词，多个触发词互为别名，第一个为命令名
+        :param users: 允许使用的QQ号列表，或 'all'
+        :param groups: 允许使用的群号列表，或 'all'
+        :param prefixes: 前缀触发词，消息首个词以其开头时触发，该词本身作为第一个参数传入
+        :param deny_users: 禁止使用的QQ号列表，优先于白名单
+        :param deny_groups: 禁止使用的群号列表，优先于白名单
+        :param deferred: 耗时命令，先立即应答，执行完成后再通过 OneBot HTTP API 发送结果
+        :param executor: 执行策略 inline / thread / process，默认同步命令放入线程池、协程命令直接执行
+        :param concurrency: 该命令同时执行的上限，不填则不限制
+        :param user_rate: 每个用户的调用频率上限 (次数, 秒)
+        :param group_rate: 每个群的调用频率上限 (次数, 秒)
+        :param command_rate: 该命令全局的调用频率上限 (次数, 秒)
+        :param dedupe: 是否丢弃 OneBot 重复投递的同一条消息
+        :param log_sample_rate: 记录调用日志的采样率，0~1，异常总是记录
+        """
         def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
-            access = {
-                "users": users,
-                "groups": groups,
-                "all": users == 'all' and groups == 'all'
-            }
+            access = AccessRule(users, groups, deny_users, deny_groups)
+            is_coroutine = asyncio.iscoroutinefunction(func)
+            policy = self.executor.resolve_policy(is_coroutine, executor)
+            limits = {scope: rate for scope, rate in
+                      (("user", user_rate), ("group", group_rate), ("command", command_rate)) if rate}
+            key_list = [keys] if isinstance(keys, str) else keys
+            name = key_list[0]
 
-            if asyncio.iscoroutinefunction(func):
+            if is_coroutine:
                 @wraps(func)
                 async def async_wrapper(*args, **kwargs):
-                    event: MessageEvent = kwargs.get("event")
-                    logger.info(f"[调用] {func.__name__} 触发用户:{event.user_id}, 入参: args={args}, kwargs={kwargs}")
+                    log = _call_logger(func, kwargs, log_sample_rate)
                     try:
-                        result: FastReplyPayload = await func(*args, **kwargs)
-                        # 可选：避免记录过大返回值（这里简单记录）
-                        logger.info(f"[调用] {func.__name__} 返回消息: {" ".join([item.data.text for item in result.reply])}, 完整消息: {result}")
+                        with _track_command(name, self.audit, kwargs.get("event")):
+                            result: FastReplyPayload = await func(*args, **kwargs)
+                        _log_result(log, func, result)
                         return result
                     except Exception as e:
                         logger.exception(f"[调用] {func.__name__} 发生异常: {e}")
@@ -76,11 +186,11 @@ class Hanerin:
             else:
                 @wraps(func)
                 def wrapper(*args, **kwargs):
-                    event: MessageEvent = kwargs.get("event")
-                    logger.info(f"[调用] {func.__name__} 触发用户:{event.user_id}, 入参: args={args}, kwargs={kwargs}")
+                    log = _call_logger(func, kwargs, log_sample_rate)
                     try:
-                        result = func(*args, **kwargs)
-                        logger.info(f"[调用] {func.__name__} 返回消息: {" ".join([item.data.text for item in result.reply])}, 完整消息: {result}")
+                        with _track_command(name, self.audit, kwargs.get("event")):
+                            result = func(*args, **kwargs)
+                        _log_result(log, func, result)
                         return result
                     except Exception as e:
                         logger.exception(f"[调用] {func.__name__} 发生异常: {e}")
@@ -88,21 +198,62 @@ class Hanerin:
 
                 wrapper = wrapper
 
-            key_list = [keys] if isinstance(keys, str) else keys
-            for key in key_list:
-                self.add_command(key, wrapper, access)
+            self.add_command(CommandSpec(name, wrapper, access, CommandBinder(func), deferred, policy, concurrency,
+                                         limits, dedupe))
+            for alias in key_list[1:]:
+                self.add_alias(alias, name)
+            prefix_list = [prefixes] if isinstance(prefixes, str) else prefixes
+            for prefix in prefix_list:
+                self.router.add_prefix(prefix, name)
 
             return wrapper
         return decorator
 
-    def add_command(self, key, value, access):
-        self.command_map[key] = [value, access, key]
-
-    def get_function(self, key):
-        # 查二维码指令
-        if key.startswith("SGWCMAID"):
-            return self.command_map.get("/qrcode", [None, None, None])
-        return self.command_map.get(key, [None, None, None])
+    def add_command(self, spec: CommandSpec):
+        self.command_map[spec.name] = spec
+        self.access_specs[spec.name] = spec.access
+        self.router.add(spec.name, spec.name)
+
+    def add_alias(self, alias, key):
+        # 别名与命令共用同一条记录，重新加载权限时一并生效
+        self.command_map[alias] = self.command_map[key]
+        self.router.add(alias, key)
+
+    def get_command(self, key) -> Optional[CommandSpec]:
+        return self.command_map.get(key)
+
+    def match(self, msg: Message) -> Optional[CommandMatch]:
+        return self.router.match(msg)
+
+    async def execute(self, spec: CommandSpec, kwargs: dict) -> FastReplyPayload:
+        if spec.policy != ExecutionPolicy.PROCESS:
+            return await self.executor.run(spec, kwargs)
+        # 包装器在子进程中执行，调用记录写不回主进程，改在这里记录
+        event = kwargs.get("event")
+        started = time.perf_counter()
+        outcome = "success"
+        try:
+            return await self.executor.run(spec, kwargs)
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.audit.record(spec.name, getattr(event, "user_id", None), getattr(event, "group_id", None),
+                              outcome, time.perf_counter() - started)
+
+    def is_duplicate(self, spec: CommandSpec, event: MessageEvent) -> bool:
+        return spec.dedupe and self.recent_events.seen(event.message_id)
+
+    def acquire_rate(self, spec: CommandSpec, event: MessageEvent) -> Optional[str]:
+        if not spec.limits:
+            return None
+        return self.rate_limiter.acquire(spec.name, spec.limits, event.user_id, event.group_id)
+
+    def stats(self) -> dict[str, int]:
+        """
+        限流与去重计数
+        """
+        return {**self.rate_limiter.counters, **self.recent_events.counters}
 
     def is_group_message(self, msg: Message) -> bool:
         first = msg[0]
@@ -112,8 +263,8 @@ class Hanerin:
 
     class Mai2:
 
-        def __init__(self, db_engine):
-            self.engine = db_engine
+        def __init__(self):
+            self.binding_dao = MaiBindingDAO()
             with open("/mnt/alist/aleafy_cloud/aleafy/Hanerin/aes.key", "rb") as f:
                 self.aes_key = f.read()
             with open("/mnt/alist/aleafy_cloud/aleafy/Hanerin/nonce", "rb") as f:
@@ -141,14 +292,16 @@ class Hanerin:
             bytes = aesgcm.decrypt(self.nonce, ciphertext, associated_data=None)
             return _bytes_to_int(bytes)
 
-        def get_mai_userid(self, qq):
-            with Session(self.engine) as session:
-                query = select(User).where(User.qq == qq)
-                user = session.exec(query).first()
-                return self._decrypt_aes_gcm(user.mai_userid)
+        async def get_mai_userid(self, qq) -> Optional[int]:
+            async with AsyncSessionLocal() as db:
+                binding = await self.binding_dao.get(db, int(qq))
+            if binding is None:
+                return None
+            return self._decrypt_aes_gcm(binding.mai_userid)
 
-        def get_userId_from_qrcode(self, qrcode):
-            response = implGetUID(qrcode)
+        async def get_userId_from_qrcode(self, qrcode):
+            # implGetUID 为阻塞的网络请求，放到线程中执行
+            response = await asyncio.to_thread(implGetUID, qrcode)
             if response['errorID']:
                 if response['errorID'] == '60001':
                     raise RuntimeError("二维码转换: 二维码内容明显无效")
@@ -158,37 +311,37 @@ class Hanerin:
                     raise RuntimeError(f"发生错误: {response}")
             return response["userID"]
 
-        def bind_mai_account(self, qq: int, qr_code_content: str) -> bool:
+        async def bind_mai_account(self, qq: int, qr_code_content: str) -> bool:
             """
             绑定华立舞萌账号
             :param qq: QQ号
             :param qr_code_content: 二维码解码出的字符串，如：SGWCMAID2504190427XXXXX
             :return:
             """
-            response = implGetUID(qr_code_content)
+            response = await asyncio.to_thread(implGetUID, qr_code_content)
             if response["errorID"] != 0:
                 return False
             user_id = response["userID"]
             user_id = self._encrypt_aes_gcm(user_id)
-            with Session(self.engine) as session:
-                query = select(User).where(User.qq == qq)
-                existing_user = session.exec(query).first()
-                if existing_user and existing_user.mai_userid == user_id:
-                    return True
-                elif existing_user:
-                    existing_user.mai_userid = user_id
-                    session.add(existing_user)
-                    session.commit()
+            async with AsyncSessionLocal() as db:
+                existing = await self.binding_dao.get(db, qq)
+                if existing and existing.mai_userid == user_id:
                     return True
+                elif existing:
+                    existing.mai_userid = user_id
+                    return await self.binding_dao.update(db, existing) is not None
                 else:
-                    new_user = User(qq=qq, mai_userid=user_id)
-                    SQLModel.metadata.create_all(self.engine)
-                    session.add(new_user)
-                    session.commit()
-                    return True
+                    return await self.binding_dao.insert(db, MaiBinding(qq=qq, mai_userid=user_id)) is not None
 
-        def get_user_music_info(self, qq):
-            return get_user_music(self.get_mai_userid(qq))
+        async def get_user_music_info(self, qq) -> Optional[dict]:
+            """
+            :return: 华立的成绩数据，该 QQ 尚未绑定华立账号时返回 None
+            """
+            # 旧的 SQLite 绑定没有迁移过来，这些用户需要重新绑定
+            mai_userid = await self.get_mai_userid(qq)
+            if mai_userid is None:
+                return None
+            return await asyncio.to_thread(get_user_music, mai_userid)
 
 
         def b50(self, qq):
@@ -210,8 +363,9 @@ class Hanerin:
         def refresh_music_database(self):
             url = "https://www.diving-fish.com/api/maimaidxprober/music_data"
             payload = {}
-            headers = {}
-            response = requests.get(url, headers=headers, data=payload)
+            headers = {"X-Request-ID": request_id_var.get()}
+            with track_http("divingfish"):
+                response = requests.get(url, headers=headers, data=payload)
             data = response.json()
             data_by_id = {entry["id"]: entry for entry in data}
             return data_by_id
@@ -0,0 +1,57 @@
+from typing import Union, List, Iterable, Optional
+
+
+def _compile_targets(targets: Union[Iterable[int], str]) -> tuple[bool, frozenset[int]]:
+    if targets == "all":
+        return True, frozenset()
+    return False, frozenset(int(target) for target in targets)
+
+
+class AccessRule:
+    """
+    编译后的命令权限规则，所有名单均为 frozenset，单次判断为 O(1)。
+    黑名单优先于白名单：命中 deny_users / deny_groups 的请求一律拒绝。
+    """
+    __slots__ = ("all", "all_users", "all_groups", "users", "groups", "deny_users", "deny_groups")
+
+    def __init__(self, users: Union[Iterable[int], str] = (), groups: Union[Iterable[int], str] = (),
+                 deny_users: Iterable[int] = (), deny_groups: Iterable[int] = ()):
+        self.all_users, self.users = _compile_targets(users)
+        self.all_groups, self.groups = _compile_targets(groups)
+        self.deny_users = frozenset(int(user) for user in deny_users)
+        self.deny_groups = frozenset(int(group) for group in deny_groups)
+        self.all = self.all_users and self.all_groups
+
+    def allows(self, user_id: Optional[int] = None, group_id: Optional[int] = None) -> bool:
+        if user_id in self.deny_users or group_id in self.deny_groups:
+            return False
+        if self.all:
+            return True
+        assert (user_id or group_id)
+        in_groups = (self.all_groups or group_id in self.groups) if group_id else False
+        in_users = (self.all_users or user_id in self.users) if user_id else False
+        if user_id and group_id:
+            return in_users or in_groups
+        elif group_id:
+            return in_groups
+        else:
+            return in_users
+
+    def merge(self, users: Iterable[int] = (), groups: Iterable[int] = (),
+              deny_users: Iterable[int] = (), deny_groups: Iterable[int] = ()) -> "AccessRule":
+        """
+        在当前规则基础上叠加名单，返回新的规则（规则本身不可变）
+        """
+        rule = AccessRule()
+        rule.all_users, rule.all_groups, rule.all = self.all_users, self.all_groups, self.all
+        rule.users = self.users | frozenset(users)
+        rule.groups = self.groups | frozenset(groups)
+        rule.deny_users = self.deny_users | frozenset(deny_users)
+        rule.deny_groups = self.deny_groups | frozenset(deny_groups)
+        return rule
+
+    def __repr__(self):
+        users = "all" if self.all_users else sorted(self.users)
+        groups = "all" if self.all_groups else sorted(self.groups)
+        return (f"AccessRule(users={users}, groups={groups}, "
+                f"deny_users={sorted(self.deny_users)}, deny_groups={sorted(self.deny_groups)})")
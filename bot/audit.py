@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+import weakref
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from DAO.auditDAO import CommandAuditDAO
+from logger import logger, request_id_var
+from metrics import registry
+
+AUDIT_RECORDS = registry.counter("hanerin_command_audit_records_total", "命令调用记录的写入结果", ("result",))
+_AUDIT_LOGS: "weakref.WeakSet[CommandAuditLog]" = weakref.WeakSet()
+registry.callback("hanerin_command_audit_pending", "等待写入的命令调用记录数",
+                  lambda: sum(log.pending for log in _AUDIT_LOGS))
+
+
+class CommandAuditLog:
+    """
+    命令调用记录的后写队列。
+    命令包装器只把记录追加到内存队列（线程池中的命令也可以直接调用），不产生数据库往返；
+    后台任务每隔 flush_interval 秒，或攒够 batch_size 条时，用多行 INSERT 批量写入。
+    队列有上限，数据库不可用时丢弃最旧的记录，不会无限占用内存。
+    """
+
+    def __init__(self, flush_interval: float = 5, batch_size: int = 200, max_pending: int = 10000):
+        """
+        :param flush_interval: 定时写入的间隔（秒）
+        :param batch_size: 每条 INSERT 语句最多写入的记录数
+        :param max_pending: 内存中最多积压的记录数
+        """
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.dao = CommandAuditDAO()
+        self._pending: deque[dict] = deque()
+        self._session_factory: Optional[async_sessionmaker] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        _AUDIT_LOGS.add(self)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self, session_factory: async_sessionmaker):
+        if self._task is not None:
+            return
+        self._session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._pid = os.getpid()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # 退出前写入剩余的记录
+        while self._pending:
+            if not await self.flush():
+                break
+
+    def record(self, command: str, user_id: Optional[int], group_id: Optional[int], outcome: str,
+               duration: float):
+        """
+        追加一条调用记录，线程安全，不阻塞
+        :param duration: 耗时（秒）
+        """
+        # 未启动，或在进程池的子进程中（fork 出来的副本不会被写入），直接丢弃
+        if self._task is None or self._pid != os.getpid():
+            return
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            AUDIT_RECORDS.inc(result="dropped")
+        self._pending.append({
+            "command": command,
+            "user_id": user_id,
+            "group_id": group_id,
+            "outcome": outcome,
+            "duration_ms": round(duration * 1000, 3),
+            "request_id": request_id_var.get(),
+            "created_at": datetime.now(),
+        })
+        if len(self._pending) >= self.batch_size:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._pending:
+                if not await self.flush():
+                    break
+
+    async def flush(self) -> bool:
+        """
+        写入一批记录
+        :return: 写入失败时返回 False，这批记录被丢弃
+        """
+        batch = []
+        while self._pending and len(batch) < self.batch_size:
+            batch.append(self._pending.popleft())
+        if not batch:
+            return True
+        started = time.perf_counter()
+        async with self._session_factory() as db:
+            count = await self.dao.insert_many(db, batch, chunk_size=self.batch_size)
+        if count is None:
+            AUDIT_RECORDS.inc(len(batch), result="failed")
+            logger.warning(f"命令调用记录写入失败, 丢弃 {len(batch)} 条")
+            return False
+        AUDIT_RECORDS.inc(len(batch), result="written")
+        logger.debug(f"写入命令调用记录 {len(batch)} 条, 耗时 {int((time.perf_counter() - started) * 1000)}ms")
+        return True
@@ -0,0 +1,29 @@
+import asyncio
+from typing import Callable, Any, Optional
+from bot.access import AccessRule
+from utils.utils import CommandBinder
+from bot.ratelimit import Rate
+
+
+class CommandSpec:
+    """
+    已注册命令在注册时编译好的全部信息，别名与命令共用同一个实例
+    """
+    __slots__ = ("name", "func", "access", "binder", "deferred", "policy", "semaphore", "limits", "dedupe")
+
+    def __init__(self, name: str, func: Callable[..., Any], access: AccessRule, binder: CommandBinder,
+                 deferred: bool = False, policy: str = "inline", concurrency: Optional[int] = None,
+                 limits: Optional[dict[str, Rate]] = None, dedupe: bool = True):
+        self.name = name            # 命令名，如 /mc
+        self.func = func            # 包装后的处理函数
+        self.access = access        # 编译后的权限规则
+        self.binder = binder        # 参数绑定器
+        self.deferred = deferred    # 是否先应答、稍后经 OneBot HTTP API 发送结果
+        self.policy = policy        # 执行策略：inline / thread / process
+        # 同一命令同时执行的上限，超出的调用排队等待
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self.limits = limits or {}  # 范围(user/group/command) -> 速率
+        self.dedupe = dedupe        # 是否丢弃重复投递的同一 message_id
+
+    def __repr__(self):
+        return f"CommandSpec(name={self.name!r}, func={self.func.__name__}, policy={self.policy}, deferred={self.deferred})"
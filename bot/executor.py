@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+import importlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from enum import StrEnum
+from functools import partial
+from typing import Optional, Any
+from bot.command import CommandSpec
+from logger import request_id_var
+
+
+class ExecutionPolicy(StrEnum):
+    INLINE = "inline"     # 直接在事件循环上执行，只适用于不阻塞的协程命令
+    THREAD = "thread"     # 在线程池中执行，适用于调用 requests 等阻塞 I/O 的命令
+    PROCESS = "process"   # 在进程池中执行，适用于图片渲染等 CPU 密集的命令
+
+
+def _call_in_process(module: str, qualname: str, request_id: str, kwargs: dict) -> Any:
+    # 子进程中按名字重新找到已注册的命令，处理函数本身无法直接被 pickle
+    request_id_var.set(request_id)
+    target = importlib.import_module(module)
+    for attr in qualname.split("."):
+        target = getattr(target, attr)
+    return target(**kwargs)
+
+
+class CommandExecutor:
+    """
+    按命令声明的执行策略调度处理函数，保证阻塞的处理函数不会卡住事件循环
+    """
+
+    def __init__(self, max_threads: int = 8, max_processes: int = 2):
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def resolve_policy(is_coroutine: bool, policy: Optional[str]) -> ExecutionPolicy:
+        """
+        确定命令的执行策略：未声明时同步命令默认放入线程池，协程命令默认直接执行
+        """
+        if policy is None:
+            return ExecutionPolicy.INLINE if is_coroutine else ExecutionPolicy.THREAD
+        policy = ExecutionPolicy(policy)
+        if is_coroutine and policy != ExecutionPolicy.INLINE:
+            raise ValueError("协程命令只能以 inline 方式执行，阻塞的命令请改写为普通函数")
+        if not is_coroutine and policy == ExecutionPolicy.INLINE:
+            raise ValueError("同步命令不能在事件循环上直接执行，请使用 thread 或 process")
+        return policy
+
+    @property
+    def threads(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="hanerin-command")
+        return self._threads
+
+    @property
+    def processes(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self.max_processes)
+        return self._processes
+
+    async def run(self, spec: CommandSpec, kwargs: dict) -> Any:
+        if spec.semaphore is None:
+            return await self._dispatch(spec, kwargs)
+        async with spec.semaphore:
+            return await self._dispatch(spec, kwargs)
+
+    async def _dispatch(self, spec: CommandSpec, kwargs: dict) -> Any:
+        if spec.policy == ExecutionPolicy.INLINE:
+            return await spec.func(**kwargs)
+        loop = asyncio.get_running_loop()
+        if spec.policy == ExecutionPolicy.THREAD:
+            # run_in_executor 不会复制 contextvars，手动带上请求关联 ID 等上下文
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.threads, partial(context.run, spec.func, **kwargs))
+        return await loop.run_in_executor(
+            self.processes,
+            partial(_call_in_process, spec.func.__module__, spec.func.__qualname__, request_id_var.get(), kwargs)
+        )
+
+    def shutdown(self):
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
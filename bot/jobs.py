@@ -0,0 +1,127 @@
+import asyncio
+from typing import Callable, Awaitable, Optional
+import aiohttp
+from logger import logger, request_id_var
+from metrics import track_http
+from utils.MessagePayloads import FastReplyPayload, MessagePayload
+from utils.MessageTypes import *
+
+
+class ReplyJobQueue:
+    """
+    耗时命令的延迟回复队列。
+    命令入队后 webhook 立即应答，由固定数量的 worker 执行命令，再通过 OneBot HTTP API 主动发送结果。
+    队列长度有上限，满了以后新的任务直接被拒绝，防止突发请求耗尽进程资源。
+    """
+
+    def __init__(self, url: str, workers: int = 4, max_depth: int = 64, timeout: float = 10):
+        """
+        :param url: OneBot HTTP API 地址
+        :param workers: 同时执行的任务数
+        :param max_depth: 排队任务数上限
+        :param timeout: 调用 OneBot HTTP API 的超时时间（秒）
+        """
+        self.url = url
+        self.workers = workers
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"延迟回复队列已启动, worker 数: {self.workers}, 队列上限: {self.max_depth}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def submit(self, name: str, job: Callable[[], Awaitable[FastReplyPayload]], event: MessageEvent) -> bool:
+        """
+        提交任务，不等待执行
+        :param name: 命令名，用于日志
+        :param job: 执行命令并返回回复的协程函数
+        :param event: 触发命令的消息事件，结果会回复到该事件所在的会话
+        :return: 队列已满或未启动时返回 False
+        """
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait((name, job, event, request_id_var.get()))
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"延迟回复队列已满({self.max_depth}), 拒绝命令 {name}")
+            return False
+
+    async def _worker(self, index: int):
+        while True:
+            name, job, event, request_id = await self._queue.get()
+            request_id_var.set(request_id)
+            try:
+                try:
+                    result = await job()
+                except Exception as e:
+                    logger.exception(f"延迟命令 {name} 执行失败: {e}")
+                    result = FastReplyPayload(
+                        reply=[TextMessageSegment(
+                            type=MessageType.TEXT,
+                            data=TextMessageSegmentData(
+                                text=f" 发生了错误，指令执行中发生了异常。如果你确信指令正确，则机器人发生了异常，请联系开发者。"
+                            )
+                        )]
+                    )
+                if result is not None:
+                    await self.deliver(event, result)
+            except Exception as e:
+                logger.exception(f"延迟命令 {name} 的结果发送失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def call_api(self, action: str, payload: dict) -> dict:
+        headers = {"X-Request-ID": request_id_var.get()}
+        with track_http("onebot"):
+            async with self._session.post(f"{self.url}/{action}", json=payload, headers=headers) as resp:
+                resp.raise_for_status()
+                return await resp.json()
+
+    async def deliver(self, event: MessageEvent, result: FastReplyPayload):
+        """
+        按快速操作的语义，把回复主动发送到事件所在的会话
+        """
+        reply = [TextMessageSegment(type=MessageType.TEXT, data=TextMessageSegmentData(text=result.reply))] \
+            if isinstance(result.reply, str) else list(result.reply)
+        is_group = event.message_type == "group"
+        if is_group and result.at_sender:
+            reply.insert(0, AtMessageSegment(type=MessageType.AT, data=AtMessageSegmentData(qq=event.user_id)))
+        payload = MessagePayload(
+            message_type=event.message_type,
+            user_id=None if is_group else event.user_id,
+            group_id=event.group_id if is_group else None,
+            message=reply,
+            auto_escape=result.auto_escape,
+        )
+        await self.call_api("send_msg", payload.model_dump(mode="json", exclude_none=True))
+
+        if not is_group:
+            return
+        if result.delete:
+            await self.call_api("delete_msg", {"message_id": event.message_id})
+        if result.kick:
+            await self.call_api("set_group_kick", {"group_id": event.group_id, "user_id": event.user_id})
+        elif result.ban:
+            await self.call_api("set_group_ban", {"group_id": event.group_id, "user_id": event.user_id,
+                                                  "duration": result.ban_duration})
@@ -0,0 +1,51 @@
+import json
+from typing import Optional, Any
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，没有时退回标准库
+    loads = json.loads
+
+
+class Peeked:
+    """
+    对原始事件的粗筛结果
+    """
+    __slots__ = ("reject", "text")
+
+    def __init__(self, reject: Optional[str] = None, text: Optional[str] = None):
+        self.reject = reject    # 不为 None 时直接拒绝，值为拒绝原因
+        self.text = text        # 第一个文本消息段的内容
+
+
+def peek_event(data: Any, self_qq: int) -> Peeked:
+    """
+    在完整的 pydantic 校验之前，只看 post_type、sub_type 和首个消息段，快速丢弃与机器人无关的事件
+    :param data: 已解析的 JSON
+    :param self_qq: 机器人QQ号
+    """
+    if not isinstance(data, dict):
+        return Peeked("无效的事件")
+    if data.get("post_type") != "message":
+        return Peeked("必须为消息")
+    if data.get("sub_type") != "normal":
+        return Peeked("必须为消息")
+
+    message = data.get("message")
+    # CQ 码字符串格式的消息不可能以 at 消息段开头，与 Hanerin.is_group_message 一致直接拒绝
+    if not isinstance(message, list) or not message:
+        return Peeked("不是群聊消息或者没at机器人")
+    first = message[0]
+    if not isinstance(first, dict) or first.get("type") != "at":
+        return Peeked("不是群聊消息或者没at机器人")
+    if str((first.get("data") or {}).get("qq")) != str(self_qq):
+        return Peeked("不是群聊消息或者没at机器人")
+
+    for segment in message[1:]:
+        if not isinstance(segment, dict) or segment.get("type") != "text":
+            continue
+        text = (segment.get("data") or {}).get("text")
+        if isinstance(text, str) and text.strip():
+            return Peeked(text=text)
+    return Peeked("找不到命令")
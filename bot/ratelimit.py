@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict, Counter
+from typing import Optional, Tuple, Hashable
+
+# (次数, 秒)，如 (3, 60) 表示每 60 秒最多 3 次，允许突发 3 次
+Rate = Tuple[int, float]
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "refill_rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.refill_rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """
+    内存中的令牌桶限流器，按 (范围, 命令, 用户/群) 分桶。
+    桶的数量有上限，超出时淘汰最久未使用的桶，避免长时间运行后内存无限增长。
+    """
+
+    def __init__(self, max_buckets: int = 10000):
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[Hashable, TokenBucket] = OrderedDict()
+        self.counters: Counter[str] = Counter()
+
+    def _bucket(self, key: Hashable, rate: Rate) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*rate)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def acquire(self, command: str, limits: dict[str, Rate], user_id: Optional[int] = None,
+                group_id: Optional[int] = None) -> Optional[str]:
+        """
+        为一次命令调用申请令牌，所有相关的桶都有余量时才一起扣除
+        :param command: 命令名
+        :param limits: 范围(user/group/command) -> 速率
+        :return: 被限流时返回触发限流的范围，否则返回 None
+        """
+        now = time.monotonic()
+        buckets = []
+        for scope, rate in limits.items():
+            if scope == "user":
+                target = user_id
+            elif scope == "group":
+                target = group_id
+            else:
+                target = None
+            if target is None and scope != "command":
+                continue
+            bucket = self._bucket((scope, command, target), rate)
+            bucket.refill(now)
+            if bucket.tokens < 1:
+                self.counters[f"rate_limited_{scope}"] += 1
+                return scope
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return None
+
+
+class RecentEvents:
+    """
+    最近处理过的 message_id 的 LRU，用来丢弃 OneBot 超时重发的重复事件
+    """
+
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        self.counters: Counter[str] = Counter()
+
+    def seen(self, message_id: int) -> bool:
+        """
+        记录事件，已经处理过时返回 True
+        """
+        if message_id in self._seen:
+            self._seen.move_to_end(message_id)
+            self.counters["duplicate_events"] += 1
+            return True
+        self._seen[message_id] = None
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return False
@@ -0,0 +1,136 @@
+import shlex
+from typing import Optional, Tuple, Dict, List
+from utils.MessageTypes import *
+
+# shlex.split 只在这些字符处分词；全角空格（U+3000）等其他 Unicode 空白不算分隔符
+_SHLEX_WHITESPACE = frozenset(shlex.shlex().whitespace)
+
+
+class _TrieNode:
+    __slots__ = ("children", "command", "prefix_command")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.command: Optional[str] = None          # 完整匹配首个词时触发的命令
+        self.prefix_command: Optional[str] = None   # 首个词以此为前缀时触发的命令
+
+
+class CommandMatch:
+    __slots__ = ("command", "args", "by_prefix")
+
+    def __init__(self, command: str, args: list[str], by_prefix: bool = False):
+        self.command = command      # command_map 中的命令名，如 /qrcode
+        self.args = args            # 已分词的参数列表
+        self.by_prefix = by_prefix  # 是否由前缀触发（此时首个词本身作为第一个参数）
+
+    def __repr__(self):
+        return f"CommandMatch(command={self.command!r}, args={self.args!r}, by_prefix={self.by_prefix})"
+
+
+class CommandRouter:
+    """
+    命令注册时编译好的路由。
+    所有触发词（含别名）与前缀触发词都存放在同一棵字符前缀树中，消息只需要在前缀树上走一遍：
+    走不通的消息（绝大多数群聊闲聊）直接判定为非命令，不会进行 shlex 分词；
+    命中候选命令后才做唯一的一次 shlex 分词。
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+
+    @staticmethod
+    def _normalize(key: str) -> str:
+        # 与旧的 parse_command 行为一致：前导的 / 可写可不写
+        return key.strip().lstrip('/')
+
+    def _node_for(self, key: str) -> _TrieNode:
+        normalized = self._normalize(key)
+        if not normalized:
+            raise ValueError(f"无效的命令触发词: '{key}'")
+        node = self._root
+        for char in normalized:
+            node = node.children.setdefault(char, _TrieNode())
+        return node
+
+    def add(self, key: str, command: str):
+        """
+        注册触发词
+        :param key: 触发词，如 /mc
+        :param command: 对应的命令名
+        """
+        self._node_for(key).command = command
+
+    def add_prefix(self, prefix: str, command: str):
+        """
+        注册前缀触发词，首个词以该前缀开头即触发命令，如二维码字符串 SGWCMAID...
+        :param prefix: 前缀
+        :param command: 对应的命令名
+        """
+        self._node_for(prefix).prefix_command = command
+
+    @staticmethod
+    def _first_text(message: Message) -> Optional[str]:
+        if isinstance(message, str):
+            raw = message.strip()
+            return raw or None
+        for segment in message:
+            if not isinstance(segment, TextMessageSegment):
+                continue
+            raw = segment.data.text.strip()
+            if raw:
+                return raw
+        return None
+
+    def _walk(self, text: str) -> Tuple[Optional[str], Optional[str], int]:
+        """
+        沿前缀树匹配文本开头
+        :return: (完整匹配的命令, 最长的前缀命令, 完整匹配的触发词长度)
+        """
+        node = self._root
+        exact, exact_len, prefix = None, 0, None
+        for i, char in enumerate(text):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.prefix_command is not None:
+                prefix = node.prefix_command
+            if node.command is not None:
+                exact, exact_len = node.command, i + 1
+        return exact, prefix, exact_len
+
+    def match(self, message: Message) -> Optional[CommandMatch]:
+        """
+        匹配消息对应的命令
+        :param message: 消息段列表
+        :return: 匹配结果，不是命令时返回 None
+        """
+        raw = self._first_text(message)
+        if raw is None:
+            return None
+        return self.match_text(raw)
+
+    def match_text(self, raw: str) -> Optional[CommandMatch]:
+        """
+        匹配第一个文本消息段的内容
+        :param raw: 文本内容
+        :return: 匹配结果，不是命令时返回 None
+        """
+        text = raw.strip().lstrip('/')
+        exact, prefix, exact_len = self._walk(text)
+        # 完整匹配要求触发词之后是 shlex 的分隔符或者消息结尾，否则 /mcx 会被当成 /mc，
+        # "/hello\u3000Bob" 也会被当成不带参数的 /hello
+        if exact is not None and exact_len < len(text) and text[exact_len] not in _SHLEX_WHITESPACE:
+            exact = None
+        if exact is None and prefix is None:
+            return None
+
+        try:
+            tokens = shlex.split(text)
+        except ValueError:
+            # shlex.split 抛异常的情况（引号未闭合等）
+            return None
+        if not tokens:
+            return None
+        if exact is not None:
+            return CommandMatch(exact, tokens[1:])
+        return CommandMatch(prefix, tokens, by_prefix=True)
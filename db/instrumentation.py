@@ -0,0 +1,136 @@
+"""
+数据库连接池与 SQL 语句的监控：
+- 连接池取连接的等待耗时（TimedAsyncAdaptedQueuePool）
+- 连接池当前占用/空闲/溢出连接数
+- 新建、失效（pool_pre_ping 探测失败）、回收（pool_recycle）关闭连接的次数
+- 每条语句的耗时，超过阈值（环境变量 db_slow_query_ms，默认 500ms）时记录慢查询日志
+所有数据都登记到 metrics.registry，由 /metrics 输出；pool_status 可直接读取某个引擎的连接池状态
+"""
+import os
+import time
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+from logger import logger, truncate
+from metrics import registry
+
+POOL_CHECKOUT_DURATION = registry.histogram(
+    "hanerin_db_pool_checkout_seconds", "从连接池取得连接的耗时（含等待与新建连接）", ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+POOL_EVENTS = registry.counter("hanerin_db_pool_events_total", "连接池中的连接新建/失效/关闭次数", ("pool", "event"))
+STATEMENT_DURATION = registry.histogram(
+    "hanerin_db_statement_duration_seconds", "SQL 语句执行耗时", ("pool", "kind"),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10))
+SLOW_QUERIES = registry.counter("hanerin_db_slow_queries_total", "超过慢查询阈值的 SQL 语句数", ("pool", "kind"))
+
+_engines: dict[str, AsyncEngine] = {}
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    统计取连接耗时的连接池，池满时排队等待的时间也计算在内
+    """
+    metrics_name = "default"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_DURATION.observe(time.perf_counter() - started, pool=self.metrics_name)
+
+    def recreate(self):
+        # engine.dispose() 会重建连接池，监控名称需要带过去
+        pool = super().recreate()
+        pool.metrics_name = self.metrics_name
+        return pool
+
+
+def pool_status(engine: AsyncEngine) -> dict[str, int]:
+    """
+    读取连接池当前状态
+    :return: size 常驻连接数上限, checked_in 空闲, checked_out 使用中, overflow 溢出连接数（可为负，表示常驻连接尚未建满）
+    """
+    pool: Pool = engine.sync_engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {}
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+def _pool_connections():
+    values = {}
+    for name, engine in _engines.items():
+        for state, count in pool_status(engine).items():
+            values[(name, state)] = count
+    return values
+
+
+registry.callback("hanerin_db_pool_connections", "连接池连接数", _pool_connections, labels=("pool", "state"))
+
+
+def _statement_kind(statement: str) -> str:
+    # 只取语句的第一个关键字作为标签，避免标签基数爆炸
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+def instrument_engine(engine: AsyncEngine, name: str = "primary", slow_query_seconds: Optional[float] = None):
+    """
+    为引擎挂上连接池与语句耗时的监控
+    :param engine: 异步引擎，建议以 poolclass=TimedAsyncAdaptedQueuePool 创建以统计取连接耗时
+    :param name: 指标中的 pool 标签
+    :param slow_query_seconds: 慢查询阈值，默认取环境变量 db_slow_query_ms
+    """
+    if slow_query_seconds is None:
+        slow_query_seconds = float(os.getenv("db_slow_query_ms", "500")) / 1000
+    threshold = slow_query_seconds
+    sync_engine = engine.sync_engine
+    if isinstance(sync_engine.pool, TimedAsyncAdaptedQueuePool):
+        sync_engine.pool.metrics_name = name
+    _engines[name] = engine
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        POOL_EVENTS.inc(pool=name, event="connect")
+
+    @event.listens_for(sync_engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        POOL_EVENTS.inc(pool=name, event="invalidate")
+
+    @event.listens_for(sync_engine, "soft_invalidate")
+    def on_soft_invalidate(dbapi_connection, connection_record, exception):
+        POOL_EVENTS.inc(pool=name, event="soft_invalidate")
+
+    @event.listens_for(sync_engine, "close")
+    def on_close(dbapi_connection, connection_record):
+        POOL_EVENTS.inc(pool=name, event="close")
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        kind = _statement_kind(statement)
+        STATEMENT_DURATION.observe(elapsed, pool=name, kind=kind)
+        if elapsed >= threshold:
+            SLOW_QUERIES.inc(pool=name, kind=kind)
+            # 参数中可能有密码哈希等敏感数据，只记录语句本身
+            logger.warning(f"慢查询({name}) {int(elapsed * 1000)}ms: {truncate(' '.join(statement.split()))}")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        # 语句执行失败时 after_cursor_execute 不会触发，需要弹出计时
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+__all__ = ["TimedAsyncAdaptedQueuePool", "instrument_engine", "pool_status"]
@@ -0,0 +1,135 @@
+"""
+版本化的数据库迁移。
+db/migrations 下每个 vNNNN_*.py 模块是一个迁移，提供 version、description 与 upgrade(conn)，
+upgrade 接收同步的 Connection，在独立的事务中执行，成功后把版本号记入 schema_version 表。
+执行前先取得数据库级别的锁（MySQL GET_LOCK / PostgreSQL advisory lock），多个进程或副本同时启动时
+只有一个在执行迁移，其余的等它完成后重新读取版本，发现已是最新便直接返回。
+应用启动时执行一次，也可以在部署时手动执行：
+    python -m db.migrate           执行所有未应用的迁移
+    python -m db.migrate --status  查看迁移状态
+"""
+import argparse
+import asyncio
+import importlib
+import pkgutil
+import time
+from contextlib import asynccontextmanager
+from types import ModuleType
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, func, select, insert, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from logger import logger
+from db import migrations
+
+_metadata = MetaData()
+
+# 迁移锁的名字与等待时间（秒）
+LOCK_NAME = "hanerin_schema_migrate"
+LOCK_ID = 0x68616e6572696e  # PostgreSQL advisory lock 使用整数键
+LOCK_TIMEOUT = 300
+
+schema_version = Table(
+    "schema_version", _metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+
+def load_migrations() -> list[ModuleType]:
+    """
+    按版本号顺序加载 db/migrations 下的所有迁移
+    """
+    modules = []
+    for info in pkgutil.iter_modules(migrations.__path__):
+        if not info.name.startswith("v"):
+            continue
+        modules.append(importlib.import_module(f"{migrations.__name__}.{info.name}"))
+    modules.sort(key=lambda m: m.version)
+    versions = [m.version for m in modules]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"迁移版本号重复: {versions}")
+    return modules
+
+
+def _applied_versions(conn) -> set[int]:
+    _metadata.create_all(conn, checkfirst=True)
+    return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+def _apply(conn, migration: ModuleType):
+    migration.upgrade(conn)
+    conn.execute(insert(schema_version).values(version=migration.version, description=migration.description))
+
+
+async def pending(engine: AsyncEngine) -> list[ModuleType]:
+    async with engine.begin() as conn:
+        applied = await conn.run_sync(_applied_versions)
+    return [m for m in load_migrations() if m.version not in applied]
+
+
+@asynccontextmanager
+async def _migration_lock(engine: AsyncEngine):
+    """
+    在一个独立的连接上持有迁移锁，迁移本身在其他连接上执行。
+    SQLite 只有单个文件且没有会话级的锁，不加锁
+    """
+    dialect = engine.dialect.name
+    if dialect not in ("mysql", "mariadb", "postgresql"):
+        yield
+        return
+    async with engine.connect() as conn:
+        if dialect == "postgresql":
+            await conn.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}s'"))
+            await conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": LOCK_ID})
+        else:
+            acquired = (await conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                                           {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT})).scalar()
+            if acquired != 1:
+                raise RuntimeError(f"{LOCK_TIMEOUT} 秒内未能取得迁移锁 {LOCK_NAME}")
+        await conn.commit()
+        try:
+            yield
+        finally:
+            if dialect == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_ID})
+            else:
+                await conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+            await conn.commit()
+
+
+async def migrate(engine: AsyncEngine) -> int:
+    """
+    执行所有未应用的迁移
+    :return: 本次执行的迁移数
+    """
+    async with _migration_lock(engine):
+        # 取得锁之后才读取版本，等待期间其他进程可能已经完成了迁移
+        todo = await pending(engine)
+        for migration in todo:
+            started = time.perf_counter()
+            # 每个迁移一个事务；MySQL 的 DDL 会隐式提交，所以迁移本身需要可以重复执行
+            async with engine.begin() as conn:
+                await conn.run_sync(_apply, migration)
+            logger.info(f"已应用迁移 {migration.version}: {migration.description}，"
+                        f"耗时 {int((time.perf_counter() - started) * 1000)}ms")
+    return len(todo)
+
+
+async def _main(status: bool):
+    from db.database import engine
+    try:
+        if status:
+            todo = {m.version for m in await pending(engine)}
+            for m in load_migrations():
+                print(f"{m.version:>4}  {'待执行' if m.version in todo else '已应用'}  {m.description}")
+        else:
+            count = await migrate(engine)
+            print(f"已执行 {count} 个迁移" if count else "数据库已是最新版本")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="执行数据库迁移")
+    parser.add_argument("--status", action="store_true", help="只查看迁移状态，不执行")
+    asyncio.run(_main(parser.parse_args().status))
@@ -0,0 +1,43 @@
+"""
+初始表结构：用户、命令权限覆盖项、QQ 与舞萌账号绑定
+此前由 create_all 建表，已存在的表会被跳过，因此可以直接在老库上执行
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, String, BigInteger, Boolean, LargeBinary
+
+version = 1
+description = "初始表结构"
+
+metadata = MetaData()
+
+Table(
+    "hanerin_users", metadata,
+    Column("user_id", Integer, primary_key=True, nullable=False, autoincrement=True),
+    Column("username", String(100), unique=True, nullable=False),
+    Column("qq", BigInteger, nullable=True),
+    Column("wahlap_user_id", String(8), nullable=True),
+    Column("df_token", String(50), nullable=True),
+    Column("hashed_password", String(60), nullable=False),
+    Column("email", String(50), nullable=True),
+    Column("avatar", String(200), nullable=True),
+    Column("buttons", String(50), nullable=True),
+    Column("roles", String(20), nullable=True),
+)
+
+Table(
+    "hanerin_command_acl", metadata,
+    Column("id", Integer, primary_key=True, nullable=False, autoincrement=True),
+    Column("command", String(50), nullable=False, index=True),
+    Column("target_type", String(10), nullable=False),
+    Column("target_id", BigInteger, nullable=False),
+    Column("allow", Boolean, nullable=False),
+)
+
+Table(
+    "hanerin_mai_bindings", metadata,
+    Column("qq", BigInteger, primary_key=True, nullable=False, autoincrement=False),
+    Column("mai_userid", LargeBinary(64), nullable=False),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
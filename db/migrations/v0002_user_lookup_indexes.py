@@ -0,0 +1,25 @@
+"""
+hanerin_users 按 qq、wahlap_user_id 查询的二级索引
+"""
+from sqlalchemy import MetaData, Table, Column, Index, BigInteger, String
+
+version = 2
+description = "hanerin_users 的 qq、wahlap_user_id 索引"
+
+metadata = MetaData()
+
+users = Table(
+    "hanerin_users", metadata,
+    Column("qq", BigInteger),
+    Column("wahlap_user_id", String(8)),
+)
+
+indexes = [
+    Index("ix_hanerin_users_qq", users.c.qq),
+    Index("ix_hanerin_users_wahlap_user_id", users.c.wahlap_user_id),
+]
+
+
+def upgrade(conn):
+    for index in indexes:
+        index.create(conn, checkfirst=True)
@@ -0,0 +1,26 @@
+"""
+命令调用记录表
+"""
+from sqlalchemy import MetaData, Table, Column, Index, Integer, BigInteger, String, Float, DateTime
+
+version = 3
+description = "命令调用记录表 hanerin_command_audit"
+
+metadata = MetaData()
+
+audit = Table(
+    "hanerin_command_audit", metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("command", String(50), nullable=False),
+    Column("user_id", BigInteger, nullable=True),
+    Column("group_id", BigInteger, nullable=True),
+    Column("outcome", String(10), nullable=False),
+    Column("duration_ms", Float, nullable=False),
+    Column("request_id", String(32), nullable=True),
+    Column("created_at", DateTime, nullable=False, index=True),
+    Index("ix_hanerin_command_audit_command_created_at", "command", "created_at"),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,65 @@
+"""
+读写分离的会话：只读的 SELECT 发往从库，写入、flush 以及加锁读发往主库。
+读己所写：
+- 会话一旦写过（flush 或执行了 INSERT/UPDATE/DELETE），之后该会话的所有语句都走主库
+- 同一个请求（按 request_id 区分）里写过以后，该请求后续新开的会话也直接走主库，避免读到从库尚未同步的旧数据
+未配置从库时所有语句都走主库，与单库时完全一致
+"""
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import Engine, Select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from logger import request_id_var
+
+# 最近一次写库的请求 ID
+_wrote_in_request: ContextVar[Optional[str]] = ContextVar("wrote_in_request", default=None)
+
+
+def _sticky() -> bool:
+    request_id = request_id_var.get()
+    return request_id != "-" and _wrote_in_request.get() == request_id
+
+
+def use_primary(session: AsyncSession | Session):
+    """
+    让会话之后的语句（包括读）都走主库，用于先读后写的场景，保证读到的是主库上的最新数据
+    """
+    session.info["primary"] = True
+
+
+class RoutingSession(Session):
+    primary: Optional[Engine] = None
+    replica: Optional[Engine] = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.replica is None:
+            return super().get_bind(mapper, clause=clause, **kw)
+        if (self.info.get("primary") or self._flushing or not isinstance(clause, Select)
+                or clause._for_update_arg is not None):
+            self._mark_written(clause)
+            return self.primary
+        if _sticky():
+            return self.primary
+        return self.replica
+
+    def _mark_written(self, clause):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["primary"] = True
+            _wrote_in_request.set(request_id_var.get())
+
+
+def configure_routing(primary: AsyncEngine, replica: Optional[AsyncEngine]) -> type[RoutingSession]:
+    """
+    生成绑定了主从引擎的会话类，作为 async_sessionmaker 的 sync_session_class
+    :param primary: 主库引擎
+    :param replica: 从库引擎，None 表示不做读写分离
+    """
+    return type("RoutingSession", (RoutingSession,), {
+        "primary": primary.sync_engine,
+        "replica": replica.sync_engine if replica is not None else None,
+    })
+
+
+__all__ = ["RoutingSession", "configure_routing", "use_primary"]
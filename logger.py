@@ -1,22 +1,79 @@
 
 import os
 import sys
+import json
+import uuid
+import traceback
 import logging
+from contextvars import ContextVar
+from typing import Any
 from loguru import logger
 
 # 确保 logs 目录存在
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# text: 普通文本日志；json: 每行一个 JSON 对象，便于日志平台检索
+LOG_FORMAT = os.getenv("log_format", "text").lower()
+# 日志中单个入参/返回值的最大长度，超出部分截断
+LOG_PAYLOAD_LIMIT = int(os.getenv("log_payload_limit", "512"))
+
+# ========== 请求关联 ID ==========
+# 每个请求（webhook 或 HTTP 接口）分配一个 ID，分发、DAO 调用、对外 HTTP 请求的日志都会带上它
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def truncate(value: Any, limit: int = LOG_PAYLOAD_LIMIT) -> str:
+    """
+    截断过长的日志内容
+    :param value: 任意对象，使用 str() 转为字符串
+    :param limit: 最大长度
+    """
+    text = str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(共{len(text)}字符)"
+
+
+def _patch_record(record):
+    record["extra"].setdefault("request_id", request_id_var.get())
+    if LOG_FORMAT == "json":
+        payload = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "logger": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+            "message": record["message"],
+        }
+        payload.update({key: value for key, value in record["extra"].items() if key != "json"})
+        if record["exception"] is not None:
+            exc_type, exc_value, exc_tb = record["exception"]
+            payload["exception"] = "".join(traceback.format_exception(exc_type, exc_value, exc_tb))
+        record["extra"]["json"] = json.dumps(payload, ensure_ascii=False, default=str)
+
+
 # ========== 清理默认 handler ==========
 logger.remove()
+logger.configure(patcher=_patch_record)
+
+if LOG_FORMAT == "json":
+    # 使用函数作为格式时 loguru 不会再额外追加异常堆栈，堆栈已写入 JSON 的 exception 字段
+    CONSOLE_FORMAT = FILE_FORMAT = lambda record: "{extra[json]}\n"
+else:
+    CONSOLE_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <magenta>{extra[request_id]}</magenta> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+    FILE_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {extra[request_id]} | {name}:{function}:{line} - {message}"
 
 # ========== 控制台输出（带颜色）==========
 logger.add(
     sink=sys.stderr,
     level="INFO",
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    colorize=True,
+    format=CONSOLE_FORMAT,
+    colorize=LOG_FORMAT != "json",
     enqueue=True,  # 异步安全（FastAPI/多线程推荐）
 )
 
@@ -27,7 +84,7 @@ logger.add(
     retention="7 days",      # 保留最近7天
     compression="gz",        # 旧日志自动压缩为 .gz
     level="INFO",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+    format=FILE_FORMAT,
     encoding="utf-8",
     enqueue=True,            # 异步安全
 )
@@ -41,8 +98,9 @@ class InterceptHandler(logging.Handler):
         logger.opt(depth=6, exception=record.exc_info).log(level, record.getMessage())
 
 # 将 SQLAlchemy 的日志重定向到 loguru
+# INFO 级别会记录每一条 SQL，仅在设置 db_echo=true 时开启
 sqlalchemy_logger = logging.getLogger("sqlalchemy")
-sqlalchemy_logger.setLevel(logging.INFO)
+sqlalchemy_logger.setLevel(logging.INFO if os.getenv("db_echo", "false").lower() == "true" else logging.WARNING)
 sqlalchemy_logger.addHandler(InterceptHandler())
 sqlalchemy_logger.propagate = False  # 避免重复输出
 
@@ -56,4 +114,4 @@ for name in ["uvicorn", "uvicorn.error", "uvicorn.access", "fastapi", "gunicorn"
 # 同时设置根 logger（可选，避免遗漏）
 logging.getLogger().handlers = [InterceptHandler()]
 # ========== 导出 logger 供其他模块使用 ==========
-__all__ = ["logger"]
\ No newline at end of file
+__all__ = ["logger", "request_id_var", "new_request_id", "truncate"]
\ No newline at end of file
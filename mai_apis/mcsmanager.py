@@ -1,4 +1,6 @@
 import requests
+from logger import request_id_var
+from metrics import track_http
 
 
 class McsManager:
@@ -9,17 +11,19 @@ class McsManager:
         self.instanceId = "9d8e1b72ebf0497bb5cbafe726bdff8c"
         self.daemonId = "51f68d79f5f14e4aa3a52ac2b12f0c19"
 
+    def _get(self, path, params):
+        with track_http("mcsmanager"):
+            return requests.get(self.endpoint + path, headers={"X-Request-ID": request_id_var.get()}, params=params)
+
     def get_daemons(self):
-        url = self.endpoint + "/overview"
-        res = requests.get(url, params={
+        res = self._get("/overview", params={
             "apikey": self.api_key
         })
         data = res.json()
         return data['data']['remote'][0]["uuid"]
 
     def get_instances(self):
-        url = self.endpoint + "/service/remote_service_instances"
-        res = requests.get(url, params={
+        res = self._get("/service/remote_service_instances", params={
             "apikey": self.api_key
         })
         return res
@@ -27,8 +31,7 @@ class McsManager:
     def start_instance(self):
         uuid = self.instanceId
         daemonId = self.daemonId
-        url = self.endpoint + "/protected_instance/open"
-        res = requests.get(url, params={
+        res = self._get("/protected_instance/open", params={
             "uuid": uuid,
             "daemonId": daemonId,
             "apikey": self.api_key
@@ -36,8 +39,7 @@ class McsManager:
         return res
 
     def execute_command(self, command):
-        url = self.endpoint + "/protected_instance/command"
-        res = requests.get(url, params={
+        res = self._get("/protected_instance/command", params={
             "uuid": self.instanceId,
             "daemonId": self.daemonId,
             "apikey": self.api_key,
@@ -46,10 +48,9 @@ class McsManager:
         return res
 
     def restart_instance(self):
-        url = self.endpoint + "/protected_instance/restart"
-        res = requests.get(url, params={
+        res = self._get("/protected_instance/restart", params={
             "apikey": self.api_key,
             "uuid": self.instanceId,
             "daemonId": self.daemonId
         })
-        return res
\ No newline at end of file
+        return res
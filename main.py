@@ -3,9 +3,9 @@ load_dotenv()
 import time
 from exceptiongroup import catch
 from fastapi.middleware.cors import CORSMiddleware
-from logger import logger
+from logger import logger, request_id_var, new_request_id
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException
 from fastapi import Response
 from bot.Hanerin import hanerin
 from db.database import init_db, get_db, AsyncSessionLocal
@@ -14,10 +14,16 @@ from io import BytesIO
 from utils.MessagePayloads import FastReplyPayload
 import json
 from mai_apis.mcsmanager import McsManager
-from services import qq,df,mai2,net
-from utils.MessageTypes import TextMessageSegment, MessageType, TextMessageSegmentData, MessageEvent
+from services import qq,df,mai2,net,metrics
+from utils.MessageTypes import TextMessageSegment, MessageType, TextMessageSegmentData, MessageEvent, \
+    ImageMessageSegment, ImageMessageSegmentData
+from utils.image_store import image_store
+from utils.passwords import password_hasher
+import asyncio
 from utils.maimai_best_50 import generate50
+from utils.maimaidx_music import music_catalog
 import os
+from datetime import datetime, timedelta
 
 mcs_api = os.getenv("mcs_api_key")
 mcs = McsManager(api_key=mcs_api)
@@ -31,7 +37,19 @@ async def lifespan(app: FastAPI):
     t2 = time.time()
     elapsed_time = t2 - t1
     logger.info(f"数据库实例初始化完成，耗时：{int(round(elapsed_time * 1000, 0))}ms.")
+    async with AsyncSessionLocal() as db:
+        await hanerin.reload_access(db)
+    await hanerin.jobs.start()
+    hanerin.audit.start(AsyncSessionLocal)
+    # 开始处理请求之前在线程中加载曲目快照，避免第一次 /b50 在事件循环上读文件、解析 JSON
+    await music_catalog.load()
+    music_refresh = asyncio.create_task(music_catalog.run())
     yield
+    music_refresh.cancel()
+    await hanerin.jobs.stop()
+    await hanerin.audit.stop()
+    password_hasher.shutdown()
+    hanerin.executor.shutdown()
 
 bot = FastAPI(lifespan=lifespan)
 
@@ -43,10 +61,23 @@ bot.add_middleware(
     allow_headers=["*"],  # 允许所有请求头
 )
 
+@bot.middleware("http")
+async def bind_request_id(request: Request, call_next):
+    # 每个请求一个关联 ID，沿用上游传入的 X-Request-ID
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 bot.include_router(qq.route)
 bot.include_router(df.route)
 bot.include_router(mai2.route)
 bot.include_router(net.route)
+bot.include_router(metrics.route)
 
 
 @hanerin.command("/hello", users=[840042638])
@@ -61,8 +92,9 @@ async def say_hello(name: str = "", **kwargs):
     )
     return reply
 
-@hanerin.command("/mc", users=[840042638], groups=[343331682])
-async def mc(command: str, content: str = "", **kwargs):
+@hanerin.command("/mc", users=[840042638], groups=[343331682], deferred=True, concurrency=1,
+                 user_rate=(3, 60))
+def mc(command: str, content: str = "", **kwargs):
     res = Response()
     data = {}
     if command in ["start","启动"]:
@@ -132,14 +164,15 @@ async def help(page=0, **kwargs):
                      f"/mc restart: 重启服务器\n"
                      f"/mc lp/理赔/创哥理赔 '<命令>': 向服务器执行命令，记得用引号包裹命令\n"
                      f"/hello <文本>: 向你打招呼！\n"
+                     f"/b50: 查询水鱼查分器上的 b50\n"
                      f"/mai bindhl <二维码扫描出的字符串>: 绑定华立账号, 请确保二维码处于有效期间内"
             )
         )]
     )
     return reply
 
-@hanerin.command("/qrcode", users=[840042638], groups=[220666756])
-async def qrcode(qr_code_content=None, **kwargs):
+@hanerin.command("/qrcode", users=[840042638], groups=[220666756], prefixes="SGWCMAID")
+def qrcode(qr_code_content=None, **kwargs):
     response_text = ""
     if qr_code_content is None or qr_code_content == "":
         response_text = f" 请输入二维码扫描出来的完整字符串"
@@ -175,7 +208,7 @@ async def mai(command, qr_code_content=None, **kwargs):
                     )
                 )]
             )
-        ok = hanerin.bind_mai_account(event.user_id, qr_code_content)
+        ok = await hanerin.mai2.bind_mai_account(event.user_id, qr_code_content)
         if not ok:
             return FastReplyPayload(
                 reply=[TextMessageSegment(
@@ -204,6 +237,34 @@ async def mai(command, qr_code_content=None, **kwargs):
             )],
         )
 
+@hanerin.command("/b50", users=[840042638], groups=[220666756], deferred=True, user_rate=(2, 60))
+async def b50(**kwargs):
+    event = kwargs.get("event")
+    pic, status = await generate50({
+        'qq': event.user_id,
+        'b50': True
+    })
+    if pic is None:
+        response_text = " 未找到你的水鱼账号，请先在水鱼查分器绑定QQ" if status == 400 else " 你在水鱼查分器设置了隐私，无法查询"
+        return FastReplyPayload(
+            reply=[TextMessageSegment(
+                type=MessageType.TEXT,
+                data=TextMessageSegmentData(
+                    text=response_text
+                )
+            )],
+        )
+    # PNG 编码较慢，放到线程中进行；相同的图片只会写入一次
+    name = await asyncio.to_thread(image_store.put_image, pic)
+    return FastReplyPayload(
+        reply=[ImageMessageSegment(
+            type=MessageType.IMAGE,
+            data=ImageMessageSegmentData(
+                file=image_store.file_uri(name)
+            )
+        )],
+    )
+
 @hanerin.command("/register", users=[840042638], groups=[220666756])
 async def register(username, password, **kwargs,):
     response_text = ""
@@ -214,6 +275,8 @@ async def register(username, password, **kwargs,):
                 response_text = " 注册发生异常: 新用户为空"
             else:
                 response_text = f" 注册成功, 用户名: {registered_user.username}"
+        except HTTPException as e:
+            response_text = f" 注册失败: {e.detail}"
         except Exception:
             response_text = " 注册失败"
         return FastReplyPayload(
@@ -223,4 +286,40 @@ async def register(username, password, **kwargs,):
                     text=response_text
                 )
             )],
-        )
\ No newline at end of file
+        )
+
+@hanerin.command("/acl", users=[840042638])
+async def acl(command, **kwargs):
+    if command in ["reload", "重载"]:
+        async with AsyncSessionLocal() as db:
+            await hanerin.reload_access(db)
+        response_text = " 权限规则已重新加载"
+    else:
+        response_text = " 无效的操作"
+    return FastReplyPayload(
+        reply=[TextMessageSegment(
+            type=MessageType.TEXT,
+            data=TextMessageSegmentData(
+                text=response_text
+            )
+        )],
+    )
+
+@hanerin.command("/stats", users=[840042638])
+async def stats(hours: int = 24, **kwargs):
+    async with AsyncSessionLocal() as db:
+        usage = await hanerin.audit.dao.usage(db, since=datetime.now() - timedelta(hours=hours))
+    lines = [f" 最近 {hours} 小时的命令调用:"]
+    for row in usage:
+        lines.append(f"{row['command']}: {row['calls']} 次, 失败 {row['errors']} 次, {row['users']} 人, "
+                     f"平均 {row['avg_ms']:.0f}ms, 最长 {row['max_ms']:.0f}ms")
+    if not usage:
+        lines.append("暂无记录")
+    return FastReplyPayload(
+        reply=[TextMessageSegment(
+            type=MessageType.TEXT,
+            data=TextMessageSegmentData(
+                text="\n".join(lines)
+            )
+        )],
+    )
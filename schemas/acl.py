@@ -0,0 +1,14 @@
+from sqlalchemy import Integer, Column, String, BigInteger, Boolean
+from db.database import Base
+
+
+class CommandAcl(Base):
+    """
+    数据库中的命令权限覆盖项，与 @hanerin.command 中声明的名单叠加
+    """
+    __tablename__ = "hanerin_command_acl"
+    id: int = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    command: str = Column(String(50), nullable=False, index=True)  # 命令名，如 /mc
+    target_type: str = Column(String(10), nullable=False)  # user 或 group
+    target_id: int = Column(BigInteger, nullable=False)
+    allow: bool = Column(Boolean, nullable=False, default=True)  # False 表示拉黑
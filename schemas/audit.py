@@ -0,0 +1,19 @@
+from sqlalchemy import Integer, Column, String, BigInteger, Float, DateTime, Index
+from db.database import Base
+
+
+class CommandAudit(Base):
+    """
+    命令调用记录，由 bot.audit.CommandAuditLog 批量写入
+    """
+    __tablename__ = "hanerin_command_audit"
+    id: int = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    command: str = Column(String(50), nullable=False)  # 命令名，如 /mc
+    user_id: int = Column(BigInteger, nullable=True)
+    group_id: int = Column(BigInteger, nullable=True)
+    outcome: str = Column(String(10), nullable=False)  # success 或 error
+    duration_ms: float = Column(Float, nullable=False)
+    request_id: str = Column(String(32), nullable=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (Index("ix_hanerin_command_audit_command_created_at", "command", "created_at"),)
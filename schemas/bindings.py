@@ -0,0 +1,11 @@
+from sqlalchemy import Column, BigInteger, LargeBinary
+from db.database import Base
+
+
+class MaiBinding(Base):
+    """
+    机器人侧 QQ 与华立舞萌账号的绑定，userid 使用 AES-GCM 加密后存储
+    """
+    __tablename__ = "hanerin_mai_bindings"
+    qq: int = Column(BigInteger, primary_key=True, nullable=False, autoincrement=False)
+    mai_userid: bytes = Column(LargeBinary(64), nullable=False)
@@ -9,8 +9,8 @@ class User(Base):
     __tablename__ = "hanerin_users"
     user_id: int = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
     username: str = Column(String(100), unique=True, nullable=False)
-    qq: int = Column(BigInteger, nullable=True, default=None)
-    wahlap_user_id: Optional[str] = Column(String(8), nullable=True, default=None)
+    qq: int = Column(BigInteger, nullable=True, default=None, index=True)
+    wahlap_user_id: Optional[str] = Column(String(8), nullable=True, default=None, index=True)
     df_token: Optional[str] = Column(String(50), nullable=True, default=None)
     hashed_password: str = Column(String(60), nullable=False)
     email: str = Column(String(50), nullable=True, default=None)
@@ -1,5 +1,6 @@
+import asyncio
 from io import BytesIO
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Response, HTTPException, status
 from fastapi.params import Query
 
 from bot.Hanerin import hanerin
@@ -10,18 +11,31 @@ from utils.maimai_best_50 import generate50
 route = APIRouter(prefix="/mai2")
 
 
+async def _user_music(qq) -> dict:
+    user_music = await hanerin.mai2.get_user_music_info(qq)
+    if user_music is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="尚未绑定华立账号，请先使用 /mai bindhl <二维码扫描出的字符串> 绑定")
+    return user_music
+
+
 @route.get("/{qq}/get_music_info")
-def get_music_info(qq):
-    return hanerin.route.get_user_music_info(qq)
+async def get_music_info(qq):
+    return await _user_music(qq)
+
+
+def _load_music_data():
+    with open('/mnt/alist/aleafy_cloud/aleafy/Hanerin/music_data.json', 'r', encoding="utf-8") as f:
+        return json.load(f)
 
 
 @route.get("/{qq}/upload_df")
-def wahlap_to_df(qq):
-    user_music = hanerin.route.get_user_music_info(qq)
+async def wahlap_to_df(qq):
+    user_music = await _user_music(qq)
     combo = ["", "fc", "fcp", "ap", "app"]
     sync = ["", "sync", "fs", "fsp", "fsd", "fsdp"]
-    with open('/mnt/alist/aleafy_cloud/aleafy/Hanerin/music_data.json', 'r', encoding="utf-8") as f:
-        music_data = json.load(f)
+    # 网络挂载盘上的文件读取放到线程中，避免阻塞事件循环
+    music_data = await asyncio.to_thread(_load_music_data)
     sy_list = []
     for music in user_music["userMusicList"]:
         music_id = music["userMusicDetailList"][0]["musicId"]
@@ -51,4 +65,4 @@ async def b50_divingfish(qq):
 
 @route.get("/getUserIdFromQRCode")
 async def get_userId_from_qrcode(qrcode=Query(...)):
-    return hanerin.mai2.get_userId_from_qrcode(qrcode)
\ No newline at end of file
+    return await hanerin.mai2.get_userId_from_qrcode(qrcode)
\ No newline at end of file
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+from metrics import registry
+
+route = APIRouter()
+
+
+@route.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
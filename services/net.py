@@ -1,10 +1,9 @@
 import os
+import time
+import uuid
 
 from dotenv import load_dotenv
-from passlib.hash import bcrypt
-from fastapi import APIRouter, Form, Depends, Query, Body, Cookie
-import hashlib
-from passlib.hash import bcrypt
+from fastapi import APIRouter, Form, Depends, Query, Body, Cookie, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 from mai_apis.SDGB.main.Config import music_data
@@ -12,6 +11,9 @@ from mai_apis.SDGB.main.MaiUserData import MaiUserData
 from DAO.userDAO import UserDAO
 from db.database import get_db, AsyncSessionLocal
 from schemas.users import User
+from utils.passwords import password_hasher, PasswordHasherBusy
+from utils.token_cache import VerifiedTokenCache, Principal
+from utils.login_limiter import LoginLimiter, client_ip, parse_networks
 from utils.ApiResponseTypes import LoginResponse, LoginResponseData, UserInfo, UserInfoResponse, PreviewResponse, \
     BaseResponse, PreviewResponseData, GameCharge, GameChargeResponse, GameChargeResponseData, UserChargeResponseData, \
     UserChargeResponse
@@ -27,6 +29,10 @@ ACCESS_TOKEN_SECRET = os.getenv("ACCESS_TOKEN_SECRET")  # 应从环境变量获
 REFRESH_TOKEN_SECRET = os.getenv("REFRESH_TOKEN_SECRET")  # 应从环境变量获取
 ACCESS_TOKEN_EXPIRE_MINUTES = 15  # 15分钟
 REFRESH_TOKEN_EXPIRE_DAYS = 7  # 7天
+token_cache = VerifiedTokenCache()
+login_limiter = LoginLimiter()
+# 受信任的反向代理（逗号分隔的 IP 或网段），只有来自这些地址的请求才采用 X-Forwarded-For 中的客户端 IP
+TRUSTED_PROXIES = parse_networks(os.getenv("trusted_proxies", "127.0.0.1,::1"))
 
 # 生成JWT token
 def create_access_token(user_id: str, expires_delta: Optional[timedelta] = None):
@@ -38,6 +44,8 @@ def create_access_token(user_id: str, expires_delta: Optional[timedelta] = None)
     payload = {
         "user_id": user_id,
         "exp": expire,
+        "iat": time.time(),  # 保留小数，与撤销时间比较时同一秒内的先后也能区分
+        "jti": uuid.uuid4().hex,  # 同一秒内签发的令牌也互不相同，撤销时不会误伤
         "type": "access"
     }
     encoded_jwt = jwt.encode(payload, ACCESS_TOKEN_SECRET, algorithm="HS256")
@@ -52,58 +60,82 @@ def create_refresh_token(user_id: str, expires_delta: Optional[timedelta] = None
     payload = {
         "user_id": user_id,
         "exp": expire,
+        "iat": time.time(),
+        "jti": uuid.uuid4().hex,
         "type": "refresh"
     }
     encoded_jwt = jwt.encode(payload, REFRESH_TOKEN_SECRET, algorithm="HS256")
     return encoded_jwt
 
-def verify_access_token(token: str) -> Optional[str]:
-    """验证access token并返回用户ID"""
+def _verify_token(token: Optional[str], token_type: str, secret: str) -> Optional[Principal]:
+    """
+    验证令牌，已验证过的令牌直接从缓存中取出身份，不再重复验证签名
+    """
+    if token is None:
+        return None
+    principal = token_cache.get(token, token_type)
+    if principal is not None:
+        return principal
     try:
-        payload = jwt.decode(token, ACCESS_TOKEN_SECRET, algorithms=["HS256"])
-        user_id: str = payload.get("user_id")
-        token_type: str = payload.get("type")
-
-        if user_id is None or token_type != "access":
-            return None
-
-        return user_id
+        payload = jwt.decode(token, secret, algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
         # Token已过期
         return None
     except jwt.PyJWTError:
-        # Token无效
+        # Token无效（包括DecodeError, InvalidSignatureError等）
         return None
+    user_id: str = payload.get("user_id")
+    if user_id is None or payload.get("type") != token_type:
+        return None
+    if token_cache.is_revoked(token, user_id, payload.get("iat")):
+        return None
+    principal = Principal(user_id, token_type)
+    token_cache.put(token, principal, payload["exp"])
+    return principal
+
+def verify_access_token(token: str) -> Optional[str]:
+    """验证access token并返回用户ID"""
+    principal = _verify_token(token, "access", ACCESS_TOKEN_SECRET)
+    return principal.user_id if principal is not None else None
 
 def verify_refresh_token(token: str) -> Optional[str]:
     """验证refresh token并返回用户ID"""
-    if token is None:
-        return None
-    try:
-        payload = jwt.decode(token, REFRESH_TOKEN_SECRET, algorithms=["HS256"])
-        user_id: str = payload.get("user_id")
-        token_type: str = payload.get("type")
+    principal = _verify_token(token, "refresh", REFRESH_TOKEN_SECRET)
+    return principal.user_id if principal is not None else None
 
-        if user_id is None or token_type != "refresh":
-            return None
+def revoke_token(token: Optional[str], secret: str):
+    """撤销令牌（注销时调用），签名无效的令牌忽略"""
+    if not token:
+        return
+    try:
+        payload = jwt.decode(token, secret, algorithms=["HS256"], options={"verify_exp": False})
+    except jwt.PyJWTError:
+        return
+    token_cache.revoke_token(token, payload["exp"])
 
-        return user_id
-    except jwt.ExpiredSignatureError:
-        # Token已过期
-        return None
-    except jwt.InvalidTokenError:
-        # Token无效（包括DecodeError, InvalidSignatureError等）
-        return None
+def revoke_user_tokens(user_id):
+    """撤销用户此前签发的所有令牌（修改密码时调用）"""
+    token_cache.revoke_user(str(user_id))
 
 route = APIRouter(prefix="/net/api")
 userDAO = UserDAO()
-def hash_password(password: str) -> str:
-    pre_hashed = hashlib.sha256(password.encode('utf-8')).hexdigest()
-    return bcrypt.hash(pre_hashed)
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+async def verify_password(plain_password: str, hashed: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed)
+
+def _busy() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="服务器繁忙，请稍后再试",
+                         headers={"Retry-After": "1"})
+
+def _request_ip(request: Request) -> Optional[str]:
+    return client_ip(request.client.host if request.client else None,
+                     request.headers.get("x-forwarded-for"), TRUSTED_PROXIES)
 
-def verify_password(plain_password: str, hashed: str) -> bool:
-    pre_hashed = hashlib.sha256(plain_password.encode('utf-8')).hexdigest()
-    return bcrypt.verify(pre_hashed, hashed)
+def _too_many(retry_after: float) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="尝试次数过多，请稍后再试",
+                         headers={"Retry-After": str(max(1, int(retry_after + 0.5)))})
 
 def mask_user_id(user_id, keep_prefix=2, keep_suffix=2, mask_char='*'):
     """
@@ -134,103 +166,210 @@ def mask_user_id(user_id, keep_prefix=2, keep_suffix=2, mask_char='*'):
 
 @route.post("/register")
 async def register(username: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_db)):
-    password_hash = hash_password(password)
+    try:
+        password_hash = await hash_password(password)
+    except PasswordHasherBusy:
+        raise _busy()
     new_user = User(username=username, hashed_password=password_hash)
     result = await userDAO.insert(db, new_user)
     return result
 
 @route.get("/verify-password")
-async def verify(username: str = Query(...), password: str = Query(...), db: AsyncSession = Depends(get_db)):
+async def verify(request: Request, username: str = Query(...), password: str = Query(...),
+                 db: AsyncSession = Depends(get_db)):
+    # 与登录共用准入控制，否则这里就是一个不限速的密码校验接口
+    ip = _request_ip(request)
+    rejected = login_limiter.acquire(ip, username)
+    if rejected is not None:
+        raise _too_many(rejected[1])
     user = await userDAO.get(db, username=username)
-    db_password = user.hashed_password
-    return verify_password(password, db_password)
+    if not user:
+        login_limiter.failure(ip, username)
+        return False
+    try:
+        verified = await verify_password(password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise _busy()
+    if verified:
+        login_limiter.success(ip, username)
+    else:
+        login_limiter.failure(ip, username)
+    return verified
+
+def _token_response(user_id: str, msg: str) -> JSONResponse:
+    """
+    签发新的 access token 与 refresh token（登录与修改密码后调用）
+    """
+    # 生成access token (短期有效)
+    access_token = create_access_token(
+        user_id=user_id,
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+    # 生成refresh token (长期有效)
+    refresh_token = create_refresh_token(
+        user_id=user_id,
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+
+    # 设置 HttpOnly Cookie
+    response = JSONResponse(content={
+        "code": 200,
+        "msg": msg,
+        "data": {
+            "token": access_token,
+            "refreshToken": refresh_token  # 仅返回 access token
+        }
+    })
+
+    # 设置 HttpOnly Cookie（仅用于 refresh token）
+    response.set_cookie(
+        key="refreshToken",
+        value=refresh_token,
+        httponly=True,      # JS 无法访问
+        secure=False,        # 仅 HTTPS
+        path="/",
+        samesite="lax",  # 防 CSRF
+        max_age=7 * 24 * 60 * 60  # 7天（秒）
+    )
+
+    return response
 
 @route.post("/auth/login")
-async def login(userName: str = Body(...), password: str = Body(...), db: AsyncSession = Depends(get_db)):
+async def login(request: Request, userName: str = Body(...), password: str = Body(...),
+                db: AsyncSession = Depends(get_db)):
+    # 准入控制在查库与 bcrypt 之前，被拒绝的请求不消耗任何计算
+    ip = _request_ip(request)
+    rejected = login_limiter.acquire(ip, userName)
+    if rejected is not None:
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content=LoginResponse(code=429, msg="尝试次数过多，请稍后再试", data=None).model_dump(),
+            headers={"Retry-After": str(max(1, int(rejected[1] + 0.5)))},
+        )
+
     user = await userDAO.get(db, username=userName)
     if not user:
+        login_limiter.failure(ip, userName)
         return LoginResponse(code=401, msg="登录失败", data=None)
 
     db_password = user.hashed_password
-    if verify_password(password, db_password):
-        # 生成access token (短期有效)
-        access_token = create_access_token(
-            user_id=str(user.user_id),
-            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        )
-
-        # 生成refresh token (长期有效)
-        refresh_token = create_refresh_token(
-            user_id=str(user.user_id),
-            expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-        )
-
-        # 设置 HttpOnly Cookie
-        response = JSONResponse(content={
-            "code": 200,
-            "msg": "登录成功",
-            "data": {
-                "token": access_token,
-                "refreshToken": refresh_token  # 仅返回 access token
-            }
-        })
-
-        # 设置 HttpOnly Cookie（仅用于 refresh token）
-        response.set_cookie(
-            key="refreshToken",
-            value=refresh_token,
-            httponly=True,      # JS 无法访问
-            secure=False,        # 仅 HTTPS
-            path="/",
-            samesite="lax",  # 防 CSRF
-            max_age=7 * 24 * 60 * 60  # 7天（秒）
-        )
-
-        return response
+    try:
+        verified = await verify_password(password, db_password)
+    except PasswordHasherBusy:
+        raise _busy()
+    if verified:
+        login_limiter.success(ip, userName)
+        return _token_response(str(user.user_id), "登录成功")
     else:
+        login_limiter.failure(ip, userName)
         return LoginResponse(code=401, msg="登录失败", data=None)
 
-@route.get("/user/info")
-async def user_info(
-        authorization: str = Header(...),
-        refresh_token: str = Cookie(None, alias="refreshToken"),
-        db: AsyncSession = Depends(get_db)
+@route.post("/auth/logout")
+async def logout(
+        authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Cookie(None, alias="refreshToken")
 ):
+    if authorization and authorization.startswith("Bearer "):
+        revoke_token(authorization[7:], ACCESS_TOKEN_SECRET)
+    revoke_token(refresh_token, REFRESH_TOKEN_SECRET)
+    response = JSONResponse(content={"code": 200, "msg": "已退出登录", "data": None})
+    response.delete_cookie(key="refreshToken", path="/")
+    return response
+
+async def get_principal(
+        request: Request,
+        authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Cookie(None, alias="refreshToken")
+) -> Principal:
+    """
+    FastAPI 依赖：解析当前请求的调用者，每个请求只解析一次，结果保存在 request.state 上。
+    access token 无效时尝试用 refresh token 续期，新签发的 access token 放在 request.state.refreshed_token
+    """
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        return principal
     # 从Authorization header中提取token (格式: "Bearer <token>")
-    if not authorization.startswith("Bearer "):
+    if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authorization header must start with 'Bearer '"
         )
-
-    token = authorization[7:]  # 移除 "Bearer " 前缀
-
-    # 验证token
-    user_id = verify_access_token(token)
-    refreshed = False
-    if user_id is None:
-        user_id = verify_refresh_token(refresh_token)
-        if user_id is None:
+    principal = _verify_token(authorization[7:], "access", ACCESS_TOKEN_SECRET)
+    if principal is None:
+        principal = _verify_token(refresh_token, "refresh", REFRESH_TOKEN_SECRET)
+        if principal is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid or expired token"
             )
-        else:
-            token = create_access_token(user_id)
-            refreshed = True
+        request.state.refreshed_token = create_access_token(principal.user_id)
+    request.state.principal = principal
+    return principal
 
-    # 根据user_id获取用户信息
-    user_data = await userDAO.get(db, int(user_id))
-    if not user_data:
+async def get_current_user(
+        request: Request,
+        principal: Principal = Depends(get_principal),
+        db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    FastAPI 依赖：当前登录的用户，每个请求只查询一次，同一请求内的处理函数与其他依赖共用
+    """
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+    user = await userDAO.get(db, int(principal.user_id))
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+    request.state.user = user
+    return user
+
+def _check_user_id(user: User, user_id):
+    # 兼容仍然传 userId 的前端：只允许操作自己的账号
+    if user_id is not None and str(user_id) != str(user.user_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+@route.post("/auth/change-password")
+async def change_password(request: Request, oldPassword: str = Body(...), newPassword: str = Body(...),
+                          user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # 校验原密码同样经过准入控制，拿到令牌的人也不能借此无限猜测密码
+    ip = _request_ip(request)
+    rejected = login_limiter.acquire(ip, user.username)
+    if rejected is not None:
+        raise _too_many(rejected[1])
+    try:
+        if not await verify_password(oldPassword, user.hashed_password):
+            login_limiter.failure(ip, user.username)
+            return BaseResponse(code=401, msg="原密码错误")
+        login_limiter.success(ip, user.username)
+        user.hashed_password = await hash_password(newPassword)
+    except PasswordHasherBusy:
+        raise _busy()
+    if await userDAO.update(db, user) is None:
+        return BaseResponse(code=500, msg="修改密码失败")
+    # 此前签发的令牌（包括其他设备上的登录）全部作废，当前会话换发新令牌
+    revoke_user_tokens(user.user_id)
+    return _token_response(str(user.user_id), "修改成功")
+
+@route.get("/user/info")
+async def user_info(
+        request: Request,
+        principal: Principal = Depends(get_principal),
+        db: AsyncSession = Depends(get_db)
+):
+    # 同一令牌的后续请求直接使用缓存的用户信息
+    if principal.info is None:
+        user_data = await get_current_user(request, principal, db)
+        principal.info = user_data.get_info().dict()
 
-    data = user_data.get_info().dict()
+    data = dict(principal.info)
 
-    if refreshed:
-        data["token"] = token
+    refreshed_token = getattr(request.state, "refreshed_token", None)
+    if refreshed_token is not None:
+        data["token"] = refreshed_token
 
     response = JSONResponse(content={
         "code": 200,
@@ -242,8 +381,8 @@ async def user_info(
     return response
 
 @route.get("/user/mai2/preview")
-async def get_preview(userId: str = Query(...), db: AsyncSession = Depends(get_db)):
-    user = await userDAO.get(db, userId)
+async def get_preview(userId: Optional[str] = Query(None), user: User = Depends(get_current_user)):
+    _check_user_id(user, userId)
     maiUserData = MaiUserData(user_id=user.wahlap_user_id)
     try:
         response = PreviewResponseData.model_validate(maiUserData.preview())
@@ -253,8 +392,8 @@ async def get_preview(userId: str = Query(...), db: AsyncSession = Depends(get_d
         return BaseResponse(code=500, msg="请求出错")
 
 @route.get("/user/mai2/getActiveTicket")
-async def get_active_ticket(userId: str = Query(...), db: AsyncSession = Depends(get_db)):
-    user = await userDAO.get(db, userId)
+async def get_active_ticket(userId: Optional[str] = Query(None), user: User = Depends(get_current_user)):
+    _check_user_id(user, userId)
     maiUserData = MaiUserData(user_id=user.wahlap_user_id)
     try:
         response = UserChargeResponseData.model_validate(maiUserData.get_active_ticket())
@@ -263,8 +402,8 @@ async def get_active_ticket(userId: str = Query(...), db: AsyncSession = Depends
         return BaseResponse(code=500, msg="请求出错")
 
 @route.post("/user/mai2/postClearTicket")
-async def clear_ticket(userId: int = Body(..., embed=True), db: AsyncSession = Depends(get_db)):
-    user = await userDAO.get(db, userId)
+async def clear_ticket(userId: Optional[int] = Body(None, embed=True), user: User = Depends(get_current_user)):
+    _check_user_id(user, userId)
     maiUserData = MaiUserData(user_id=user.wahlap_user_id, music_data=music_data)
     try:
         response = maiUserData.login().commit()
@@ -273,8 +412,9 @@ async def clear_ticket(userId: int = Body(..., embed=True), db: AsyncSession = D
         return BaseResponse(code=500, msg=f"清除功能票出错: {e}", data={"error_no": 1, "error_msg": str(e)})
 
 @route.post("/user/mai2/postTicket")
-async def post_ticket(userId: int = Body(..., embed=True), ticketId: int = Body(...), db: AsyncSession = Depends(get_db)):
-    user = await userDAO.get(db, userId)
+async def post_ticket(ticketId: int = Body(...), userId: Optional[int] = Body(None),
+                      user: User = Depends(get_current_user)):
+    _check_user_id(user, userId)
     maiUserData = MaiUserData(user_id=user.wahlap_user_id)
     try:
         maiUserData.login(load_full_data=False).ticket(ticketId=ticketId).logout()
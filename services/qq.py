@@ -1,41 +1,47 @@
-from fastapi import APIRouter, Response
-from logger import logger
+from fastapi import APIRouter, Request, Response
+from pydantic import TypeAdapter, ValidationError
+from logger import logger, truncate
 from bot.Hanerin import hanerin
 from utils.MessagePayloads import FastReplyPayload
 from utils.MessageTypes import Event, MessageEvent, TextMessageSegment, MessageType, TextMessageSegmentData
-from utils.utils import parse_command, parse_no_backslash_command, handle_command_as_arg_commands, bind_args
+from bot.prefilter import peek_event, loads
 
 route = APIRouter(prefix="/qq")
 
 noQQ = True
+EVENT_ADAPTER = TypeAdapter(Event)
+
+
 @route.post("/")
-async def routing(event: Event) -> Response:
+async def routing(request: Request) -> Response:
     if noQQ:
         return None
 
-    if not isinstance(event, MessageEvent):
-        return Response("必须为消息", status_code=404)
-
-    if event.sub_type != "normal":
-        return Response("必须为消息", status_code=404)
-    content = event.message
-    logger.info(f"收到消息 『{event.raw_message}』")
-    if not hanerin.is_group_message(event.message):
-        return Response("不是群聊消息或者没at机器人", status_code=404)
+    # 先用 JSON 解析结果粗筛，心跳、未 at 机器人的群聊和非命令消息不做完整的 pydantic 校验
+    try:
+        data = loads(await request.body())
+    except ValueError:
+        return Response("无效的事件", status_code=400)
+    peeked = peek_event(data, hanerin.qq)
+    if peeked.reject is not None:
+        return Response(peeked.reject, status_code=404)
+    matched = hanerin.router.match_text(peeked.text)
+    if matched is None:
+        return Response("找不到命令", status_code=404)
 
-    command, arg_list = parse_command(content)
-    func = hanerin.get_function(command)[0]
-    command_name = command
+    try:
+        event: MessageEvent = EVENT_ADAPTER.validate_python(data)
+    except ValidationError as e:
+        logger.warning(f"事件校验失败: {truncate(e)}")
+        return Response("无效的事件", status_code=422)
+    logger.info(f"收到消息 『{truncate(event.raw_message)}』")
 
-    if func is None:
-        logger.info(f"该请求试图使用不存在的命令{command}, 尝试匹配非指令对答")
-        command, arg_list = parse_no_backslash_command(content)
-        func, _, command_name = hanerin.get_function(command)
-        arg_list = handle_command_as_arg_commands(command_name, command, arg_list)
-        if func is None:
-            return Response("找不到命令", status_code=404)
+    spec = hanerin.get_command(matched.command)
+    if hanerin.is_duplicate(spec, event):
+        logger.info(f"丢弃重复投递的消息 {event.message_id}")
+        return None
     try:
-        if not hanerin.has_access(command_name, event.user_id, event.group_id):
+        if not spec.access.allows(event.user_id, event.group_id):
             reply = FastReplyPayload(
                 reply=[TextMessageSegment(
                     type=MessageType.TEXT,
@@ -45,9 +51,21 @@ async def routing(event: Event) -> Response:
                 )]
             )
             return reply
-        args = bind_args(func, arg_list)
+        if hanerin.acquire_rate(spec, event) is not None:
+            reply = FastReplyPayload(
+                reply=[TextMessageSegment(
+                    type=MessageType.TEXT,
+                    data=TextMessageSegmentData(
+                        text=f" 操作太频繁，请稍后再试"
+                    )
+                )]
+            )
+            return reply
+        args = spec.binder.bind(matched.args)
         args["event"] = event
-        return await func(**args)
+        if spec.deferred:
+            return defer(spec.name, lambda: hanerin.execute(spec, args), event)
+        return await hanerin.execute(spec, args)
     except Exception as e:
         logger.exception(f"发生错误: {e}")
         reply = FastReplyPayload(
@@ -61,6 +79,21 @@ async def routing(event: Event) -> Response:
         return reply
 
 
+def defer(name, job, event: MessageEvent) -> FastReplyPayload:
+    if hanerin.jobs.submit(name, job, event):
+        text = " 收到，正在处理中..."
+    else:
+        text = " 机器人正忙，请稍后再试"
+    return FastReplyPayload(
+        reply=[TextMessageSegment(
+            type=MessageType.TEXT,
+            data=TextMessageSegmentData(
+                text=text
+            )
+        )]
+    )
+
+
 @route.get("/{qq}/userid")
-def get_userid(qq):
-    return hanerin.route.get_mai_userid(qq)
+async def get_userid(qq):
+    return await hanerin.mai2.get_mai_userid(qq)
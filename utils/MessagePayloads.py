@@ -16,10 +16,10 @@ class MessagePayload(BaseModel):
     auto_escape: Optional[bool] = False
 
     @model_validator(mode="after")
-    def check_user_or_group(self, model):
-        if not model.user_id and not model.group_id:
+    def check_user_or_group(self):
+        if not self.user_id and not self.group_id:
             raise ValueError("'user_id' 或 'group_id' 必须有一个.")
-        return model
+        return self
 
 
 class FastReplyPayload(BaseModel):
@@ -28,8 +28,17 @@ class AtMessageSegment(BaseMessageSegment):
     type: Literal[MessageType.AT]
     data: AtMessageSegmentData
 
+class ImageMessageSegmentData(BaseModel):
+    file: str  # file:///绝对路径、http(s):// 链接或 base64://
+    url: Optional[str] = None
+    summary: Optional[str] = None
+
+class ImageMessageSegment(BaseMessageSegment):
+    type: Literal[MessageType.IMAGE]
+    data: ImageMessageSegmentData
+
 MessageSegment = Annotated[
-    TextMessageSegment | AtMessageSegment,
+    TextMessageSegment | AtMessageSegment | ImageMessageSegment,
     Field(discriminator='type')
 ]
 
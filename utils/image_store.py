@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional
+from PIL import Image
+from logger import logger
+
+
+class ImageStore:
+    """
+    本地按内容寻址的图片缓存。
+    图片以 sha256 命名写入一次，之后通过 file:// 路径引用，不再把整张图 base64 塞进每条回复。
+    总大小超过上限时按最近使用时间淘汰。
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        :param root: 缓存目录
+        :param max_bytes: 缓存总大小上限（字节）
+        """
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()  # 文件名 -> 大小，按最近使用排序
+        self._total = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total += size
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def file_uri(self, name: str) -> str:
+        return f"file://{self.path(name)}"
+
+    def put(self, data: bytes, suffix: str = ".png") -> str:
+        """
+        写入图片，内容相同的图片只写一次
+        :param data: 图片字节
+        :param suffix: 文件后缀
+        :return: 缓存中的文件名（sha256 + 后缀）
+        """
+        name = hashlib.sha256(data).hexdigest() + suffix
+        with self._lock:
+            if name in self._entries:
+                try:
+                    os.utime(self.path(name))
+                    self._entries.move_to_end(name)
+                    return name
+                except FileNotFoundError:
+                    # 文件已被清理或手动删除，丢弃过时的索引后重新写入
+                    self._total -= self._entries.pop(name)
+                    logger.debug(f"图片缓存文件 {name} 已不存在，重新写入")
+            tmp = self.path(f".{name}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path(name))
+            self._entries[name] = len(data)
+            self._total += len(data)
+            self._evict(keep=name)
+        return name
+
+    def put_image(self, image: Image.Image, format: str = "PNG") -> str:
+        """
+        编码并写入 PIL 图片
+        :return: 缓存中的文件名
+        """
+        buffer = BytesIO()
+        image.save(buffer, format=format)
+        return self.put(buffer.getvalue(), suffix=f".{format.lower()}")
+
+    def get(self, name: str) -> Optional[str]:
+        """
+        :return: 图片的本地路径，不在缓存中时返回 None
+        """
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+            return self.path(name)
+
+    def _evict(self, keep: str):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                break
+            self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            logger.debug(f"图片缓存超出上限，淘汰 {name}")
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+
+image_store = ImageStore(
+    root=os.getenv("image_store_dir", "cache/images"),
+    max_bytes=int(os.getenv("image_store_max_mb", "512")) * 1024 * 1024,
+)
@@ -0,0 +1,153 @@
+import ipaddress
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Hashable, Sequence
+from bot.ratelimit import Rate
+from metrics import registry
+
+LOGIN_REJECTIONS = registry.counter("hanerin_login_rejections_total", "登录准入控制拒绝的次数", ("reason",))
+
+Networks = tuple[ipaddress.IPv4Network | ipaddress.IPv6Network, ...]
+
+
+def parse_networks(value: str) -> Networks:
+    """
+    解析逗号分隔的 IP 或网段，如 "127.0.0.1,::1,10.0.0.0/8"
+    """
+    return tuple(ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip())
+
+
+def _is_trusted(address: str, trusted: Networks) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str], trusted: Networks) -> Optional[str]:
+    """
+    取得真实的客户端 IP。
+    只有直连的对端是受信任的反向代理时才采用 X-Forwarded-For，从右往左跳过受信任的代理，
+    第一个不受信任的地址就是客户端；直连的客户端伪造的 X-Forwarded-For 会被忽略。
+    :param peer: 直连的对端地址
+    :param forwarded_for: X-Forwarded-For 请求头
+    :param trusted: 受信任的代理地址
+    """
+    if not peer or not forwarded_for or not _is_trusted(peer, trusted):
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, trusted):
+            return hop
+    # 整条链都是受信任的代理，取最早的一跳
+    return hops[0] if hops else peer
+
+
+class _Window:
+    __slots__ = ("attempts", "failures", "blocked_until")
+
+    def __init__(self):
+        self.attempts: deque[float] = deque()  # 窗口内的尝试时间
+        self.failures = 0                      # 连续失败次数，登录成功后清零
+        self.blocked_until = 0.0               # 退避结束时间
+
+
+class LoginLimiter:
+    """
+    登录准入控制，在查询用户与 bcrypt 校验之前执行：
+    - 按 IP 与按用户名的滑动窗口限流，窗口内尝试次数达到上限后拒绝
+    - 连续失败超过允许的次数后进入指数退避，每多失败一次，等待时间翻倍，直到 max_backoff
+    退避按 IP 以及 (IP, 用户名) 计算，不单独按用户名：否则任何人都能用错误的密码把已知的账号无限期锁住。
+    针对单个账号的分布式猜测由按用户名的滑动窗口限速，它只在攻击持续期间生效，窗口过去即恢复。
+    各范围分别使用有上限的 LRU 存放，不存在的用户名同样计数，不会因为大量随机用户名而无限增长。
+    """
+
+    def __init__(self, ip_rate: Rate = (20, 60), user_rate: Rate = (10, 60), ip_free_failures: int = 10,
+                 user_free_failures: int = 3, base_backoff: float = 1, max_backoff: float = 900, max_keys: int = 10000):
+        """
+        :param ip_rate: 每个 IP 的尝试次数上限 (次数, 秒)
+        :param user_rate: 每个用户名的尝试次数上限 (次数, 秒)
+        :param ip_free_failures: 同一 IP 不触发退避的连续失败次数，IP 可能被多人共用，给得宽一些
+        :param user_free_failures: 同一 IP 上同一用户名不触发退避的连续失败次数
+        :param base_backoff: 首次退避的时长（秒）
+        :param max_backoff: 退避时长上限（秒）
+        :param max_keys: 每个范围最多记录的数量
+        """
+        # 范围 -> 限流 / 不触发退避的失败次数，None 表示该范围不做这项检查
+        self.rates: dict[str, Optional[Rate]] = {"ip": ip_rate, "user": user_rate, "ip_user": None}
+        self.free_failures: dict[str, Optional[int]] = {"ip": ip_free_failures, "user": None,
+                                                        "ip_user": user_free_failures}
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_keys = max_keys
+        self._windows: dict[str, OrderedDict[Hashable, _Window]] = {scope: OrderedDict() for scope in self.rates}
+
+    def _window(self, scope: str, key: Hashable) -> _Window:
+        windows = self._windows[scope]
+        window = windows.get(key)
+        if window is None:
+            window = windows[key] = _Window()
+            if len(windows) > self.max_keys:
+                windows.popitem(last=False)
+        else:
+            windows.move_to_end(key)
+        return window
+
+    def _keys(self, ip: Optional[str], username: Optional[str]):
+        username = username.strip().lower() if username else None
+        if ip:
+            yield "ip", ip
+        if username:
+            yield "user", username
+        if ip and username:
+            yield "ip_user", (ip, username)
+
+    def acquire(self, ip: Optional[str], username: Optional[str]) -> Optional[tuple[str, float]]:
+        """
+        申请一次登录尝试，所有相关的窗口都未超限时才一起记录
+        :return: 被拒绝时返回 (原因, 建议的重试等待秒数)，否则返回 None
+        """
+        now = time.monotonic()
+        windows = []
+        for scope, key in self._keys(ip, username):
+            window = self._window(scope, key)
+            if window.blocked_until > now:
+                LOGIN_REJECTIONS.inc(reason=f"backoff_{scope}")
+                return f"backoff_{scope}", window.blocked_until - now
+            if self.rates[scope] is None:
+                continue
+            limit, per = self.rates[scope]
+            while window.attempts and window.attempts[0] <= now - per:
+                window.attempts.popleft()
+            if len(window.attempts) >= limit:
+                LOGIN_REJECTIONS.inc(reason=f"rate_limited_{scope}")
+                return f"rate_limited_{scope}", window.attempts[0] + per - now
+            windows.append(window)
+        for window in windows:
+            window.attempts.append(now)
+        return None
+
+    def failure(self, ip: Optional[str], username: Optional[str]):
+        """
+        记录一次失败的登录（用户不存在或密码错误）
+        """
+        now = time.monotonic()
+        for scope, key in self._keys(ip, username):
+            if self.free_failures[scope] is None:
+                continue
+            window = self._window(scope, key)
+            window.failures += 1
+            over = window.failures - self.free_failures[scope]
+            if over > 0:
+                window.blocked_until = now + min(self.max_backoff, self.base_backoff * 2 ** (over - 1))
+
+    def success(self, ip: Optional[str], username: Optional[str]):
+        """
+        登录成功，清除连续失败记录
+        """
+        for scope, key in self._keys(ip, username):
+            window = self._windows[scope].get(key)
+            if window is not None:
+                window.failures = 0
+                window.blocked_until = 0.0
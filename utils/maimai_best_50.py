@@ -5,7 +5,9 @@ from typing import Optional, Dict, List, Tuple
 
 import aiohttp
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
-from utils.maimaidx_music import total_list, get_cover_len5_id
+from logger import request_id_var
+from metrics import track_http
+from utils.maimaidx_music import music_catalog, get_cover_len5_id
 
 
 scoreRank = 'D C B BB BBB A AA AAA S S+ SS SS+ SSS SSS+'.split(' ')
@@ -42,8 +44,10 @@ class ChartInfo(object):
         ri = rate.index(data["rate"])
         fc = ['', 'fc', 'fcp', 'ap', 'app']
         fi = fc.index(data["fc"])
+        # 曲目数据尚未加载完成时退回成绩自带的 song_id
+        music = music_catalog.by_title(data["title"])
         return cls(
-            idNum=total_list.by_title(data["title"]).id,
+            idNum=music.id if music is not None else str(data["song_id"]),
             title=data["title"],
             diff=data["level_index"],
             ra=data["ra"],
@@ -394,19 +398,22 @@ def computeRa(ds: float, achievement: float) -> int:
 
 
 async def generate50(payload: Dict) -> Tuple[Optional[Image.Image], bool]:
-    async with aiohttp.request("POST", "https://www.diving-fish.com/api/maimaidxprober/query/player", json=payload) as resp:
-        if resp.status == 400:
-            return None, 400
-        if resp.status == 403:
-            return None, 403
-        sd_best = BestList(35)
-        dx_best = BestList(15)
-        obj = await resp.json()
-        dx: List[Dict] = obj["charts"]["dx"]
-        sd: List[Dict] = obj["charts"]["sd"]
-        for c in sd:
-            sd_best.push(ChartInfo.from_json(c))
-        for c in dx:
-            dx_best.push(ChartInfo.from_json(c))
-        pic = DrawBest(sd_best, dx_best, obj["nickname"]).getDir()
-        return pic, 0
+    with track_http("divingfish"):
+        async with aiohttp.request("POST", "https://www.diving-fish.com/api/maimaidxprober/query/player", json=payload,
+                                   headers={"X-Request-ID": request_id_var.get()}) as resp:
+            if resp.status == 400:
+                return None, 400
+            if resp.status == 403:
+                return None, 403
+            obj = await resp.json()
+    sd_best = BestList(35)
+    dx_best = BestList(15)
+    dx: List[Dict] = obj["charts"]["dx"]
+    sd: List[Dict] = obj["charts"]["sd"]
+    for c in sd:
+        sd_best.push(ChartInfo.from_json(c))
+    for c in dx:
+        dx_best.push(ChartInfo.from_json(c))
+    # 绘图是同步的 PIL 合成加封面、字体文件读取，放到线程中进行，避免阻塞事件循环
+    pic = await asyncio.to_thread(lambda: DrawBest(sd_best, dx_best, obj["nickname"]).getDir())
+    return pic, 0
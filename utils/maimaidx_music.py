@@ -1,9 +1,20 @@
+import asyncio
 import json
+import os
 import random
+import threading
+import time
 from typing import Dict, List, Optional, Union, Tuple, Any
 from copy import deepcopy
 
-import requests
+import aiohttp
+from dotenv import load_dotenv
+from logger import logger, request_id_var
+from metrics import track_http
+
+load_dotenv()
+
+MUSIC_DATA_URL = 'https://www.diving-fish.com/api/maimaidxprober/music_data'
 
 def get_cover_len5_id(mid) -> str:
     mid = int(mid)
@@ -103,17 +114,22 @@ class Music(Dict):
 
 
 class MusicList(List[Music]):
+    def _indexes(self) -> Tuple[Dict[str, Music], Dict[str, Music]]:
+        # 首次按 id / 标题查找时建立索引，列表长度变化后重建；同名时与逐个查找一样取第一首
+        indexes = self.__dict__.get('_index_cache')
+        if indexes is None or indexes[0] != len(self):
+            by_id, by_title = {}, {}
+            for music in self:
+                by_id.setdefault(music.id, music)
+                by_title.setdefault(music.title, music)
+            indexes = self.__dict__['_index_cache'] = (len(self), by_id, by_title)
+        return indexes[1], indexes[2]
+
     def by_id(self, music_id: str) -> Optional[Music]:
-        for music in self:
-            if music.id == music_id:
-                return music
-        return None
+        return self._indexes()[0].get(music_id)
 
     def by_title(self, music_title: str) -> Optional[Music]:
-        for music in self:
-            if music.title == music_title:
-                return music
-        return None
+        return self._indexes()[1].get(music_title)
 
     def random(self):
         return random.choice(self)
@@ -151,9 +167,136 @@ class MusicList(List[Music]):
         return new_list
 
 
-obj = requests.get('https://www.diving-fish.com/api/maimaidxprober/music_data').json()
-total_list: MusicList = MusicList(obj)
-for __i in range(len(total_list)):
-    total_list[__i] = Music(total_list[__i])
-    for __j in range(len(total_list[__i].charts)):
-        total_list[__i].charts[__j] = Chart(total_list[__i].charts[__j])
+def build_music_list(obj: List[dict]) -> MusicList:
+    total_list: MusicList = MusicList(obj)
+    for __i in range(len(total_list)):
+        total_list[__i] = Music(total_list[__i])
+        for __j in range(len(total_list[__i].charts)):
+            total_list[__i].charts[__j] = Chart(total_list[__i].charts[__j])
+    return total_list
+
+
+class MusicCatalog:
+    """
+    水鱼曲目数据。
+    首次使用时才从本地快照文件加载，之后的查询都在内存中完成；后台任务定期从水鱼拉取最新数据，
+    成功后原子替换快照文件与内存中的列表。启动与导入不再依赖水鱼是否可以访问。
+    """
+
+    def __init__(self, snapshot_path: str, url: str = MUSIC_DATA_URL, refresh_interval: float = 86400,
+                 timeout: float = 30):
+        """
+        :param snapshot_path: 本地快照文件路径
+        :param url: 水鱼曲目数据接口
+        :param refresh_interval: 后台刷新间隔（秒）
+        :param timeout: 拉取数据的超时时间（秒）
+        """
+        self.snapshot_path = snapshot_path
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.updated_at: Optional[float] = None
+        self._music: Optional[MusicList] = None
+        self._lock = threading.Lock()
+
+    @property
+    def music(self) -> MusicList:
+        """
+        当前的曲目列表，首次访问时从快照加载
+        """
+        music = self._music
+        if music is None:
+            with self._lock:
+                if self._music is None:
+                    self._music = self._load_snapshot()
+                music = self._music
+        return music
+
+    async def load(self) -> MusicList:
+        """
+        在线程中完成首次加载（读取快照与解析 JSON），应用启动时调用，之后访问 music 不会阻塞事件循环
+        """
+        if self._music is not None:
+            return self._music
+        return await asyncio.to_thread(lambda: self.music)
+
+    def by_id(self, music_id: str) -> Optional[Music]:
+        return self.music.by_id(music_id)
+
+    def by_title(self, music_title: str) -> Optional[Music]:
+        return self.music.by_title(music_title)
+
+    def _load_snapshot(self) -> MusicList:
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                obj = json.load(f)
+        except FileNotFoundError:
+            # 后台任务第一次刷新成功后会写入快照
+            logger.warning(f"曲目快照 {self.snapshot_path} 不存在，等待后台刷新")
+            return MusicList()
+        except (OSError, ValueError) as e:
+            logger.error(f"曲目快照 {self.snapshot_path} 读取失败: {e}")
+            return MusicList()
+        self.updated_at = os.path.getmtime(self.snapshot_path)
+        logger.info(f"已从快照加载 {len(obj)} 首曲目")
+        return build_music_list(obj)
+
+    def _write_snapshot(self, obj: List[dict]):
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def refresh(self) -> bool:
+        """
+        从水鱼拉取曲目数据，写入快照并替换内存中的列表
+        :return: 是否刷新成功，失败时继续使用原有数据
+        """
+        try:
+            headers = {"X-Request-ID": request_id_var.get()}
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+                with track_http("divingfish"):
+                    async with session.get(self.url, headers=headers) as resp:
+                        resp.raise_for_status()
+                        obj = await resp.json(content_type=None)
+            if not isinstance(obj, list) or not obj:
+                raise ValueError("返回的曲目数据为空")
+            music = await asyncio.to_thread(build_music_list, obj)
+            await asyncio.to_thread(self._write_snapshot, obj)
+        except Exception as e:
+            logger.warning(f"刷新曲目数据失败，继续使用现有数据: {e}")
+            return False
+        self._music = music
+        self.updated_at = time.time()
+        logger.info(f"曲目数据已刷新，共 {len(music)} 首")
+        return True
+
+    async def run(self, retry_interval: float = 300):
+        """
+        后台定期刷新，快照缺失或已过期时立即刷新一次
+        :param retry_interval: 刷新失败后的重试间隔（秒）
+        """
+        await self.load()
+        while True:
+            age = time.time() - self.updated_at if self.updated_at is not None else None
+            if age is None or age >= self.refresh_interval:
+                delay = self.refresh_interval if await self.refresh() else min(retry_interval, self.refresh_interval)
+            else:
+                delay = self.refresh_interval - age
+            await asyncio.sleep(delay)
+
+
+music_catalog = MusicCatalog(
+    snapshot_path=os.getenv("music_snapshot_path", "cache/music_data.json"),
+    refresh_interval=float(os.getenv("music_refresh_hours", "24")) * 3600,
+)
+
+
+def __getattr__(name):
+    # 兼容旧代码的 from utils.maimaidx_music import total_list，访问时才加载
+    if name == "total_list":
+        return music_catalog.music
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
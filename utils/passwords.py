@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from dotenv import load_dotenv
+from passlib.hash import bcrypt
+from metrics import registry
+
+load_dotenv()
+
+PASSWORD_HASH_DURATION = registry.histogram(
+    "hanerin_password_hash_seconds", "密码哈希/校验耗时（含排队）", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+PASSWORD_HASH_REJECTED = registry.counter(
+    "hanerin_password_hash_rejected_total", "排队已满被拒绝的密码哈希/校验次数", ("operation",))
+PASSWORD_HASH_IN_FLIGHT = registry.gauge("hanerin_password_hash_in_flight", "正在计算或排队的密码哈希/校验数")
+
+
+class PasswordHasherBusy(Exception):
+    """排队等待哈希的请求过多"""
+    pass
+
+
+def _pre_hash(password: str) -> str:
+    # bcrypt 只使用前 72 字节，先做一次 SHA-256
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+
+class PasswordHasher:
+    """
+    bcrypt 哈希与校验放在独立的线程池中执行（bcrypt 计算时会释放 GIL），不阻塞事件循环。
+    同时进行的计算数为线程数，另有 max_waiting 个排队名额，超出时直接抛出 PasswordHasherBusy，
+    登录高峰不会拖慢聊天消息的分发。
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = 2, max_waiting: int = 16):
+        """
+        :param rounds: bcrypt 的 cost（2^rounds 次迭代），只影响新生成的哈希，已有哈希按自身记录的 cost 校验
+        :param max_workers: 同时计算的哈希数
+        :param max_waiting: 计算名额用尽时允许排队的请求数
+        """
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_waiting = max_waiting
+        self._bcrypt = bcrypt.using(rounds=rounds)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._admitted = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hanerin-bcrypt")
+        return self._executor
+
+    async def _run(self, operation: str, func, *args):
+        if self._admitted >= self.max_workers + self.max_waiting:
+            PASSWORD_HASH_REJECTED.inc(operation=operation)
+            raise PasswordHasherBusy(f"密码{'哈希' if operation == 'hash' else '校验'}排队已满")
+        self._admitted += 1
+        PASSWORD_HASH_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self._admitted -= 1
+            PASSWORD_HASH_IN_FLIGHT.dec()
+            PASSWORD_HASH_DURATION.observe(time.perf_counter() - started, operation=operation)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self._bcrypt.hash, _pre_hash(password))
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verify", bcrypt.verify, _pre_hash(password), hashed)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv("bcrypt_rounds", "12")),
+    max_workers=int(os.getenv("bcrypt_workers", "2")),
+    max_waiting=int(os.getenv("bcrypt_max_waiting", "16")),
+)
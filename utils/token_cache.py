@@ -0,0 +1,134 @@
+import hashlib
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from metrics import registry
+
+TOKEN_CACHE_REQUESTS = registry.counter("hanerin_token_cache_requests_total", "已验证令牌缓存的命中/未命中次数", ("result",))
+TOKEN_CACHE_ENTRIES = registry.gauge("hanerin_token_cache_entries", "已验证令牌缓存中的条目数")
+TOKEN_REVOCATIONS = registry.gauge("hanerin_token_revocations", "撤销名单中尚未过期的令牌数")
+
+
+class Principal:
+    """
+    已验证令牌对应的身份
+    """
+    __slots__ = ("user_id", "token_type", "info")
+
+    def __init__(self, user_id: str, token_type: str, info: Optional[dict] = None):
+        self.user_id = user_id        # 令牌中的 user_id
+        self.token_type = token_type  # access 或 refresh
+        self.info = info              # 已查询过的用户信息，避免重复查库
+
+
+class VerifiedTokenCache:
+    """
+    已验证 JWT 的缓存，以令牌的 SHA-256 摘要为键（不在内存中保存令牌原文）。
+    条目最晚在令牌自身的 exp 过期，同时不超过 max_ttl，以限制缓存的用户信息过时的时间；总数超过上限时淘汰最久未用的条目。
+    注销与修改密码时通过 revoke_token / revoke_user 撤销：除了清除缓存，还会记录到撤销名单，
+    之后即使签名仍然有效，令牌也不再被接受。撤销名单没有条数上限，记录只在令牌自身过期后才删除，
+    不会为了腾出空间让已撤销的令牌重新生效；名单的大小受令牌签发速度（登录有准入控制）与有效期限制。
+    注意：撤销状态只保存在本进程的内存中，重启后丢失，多个进程之间也不共享，
+    重启前已撤销但尚未过期的令牌会重新有效，直到各自的 exp。
+    """
+
+    def __init__(self, max_size: int = 4096, max_ttl: float = 300):
+        """
+        :param max_size: 最多缓存的令牌数
+        :param max_ttl: 条目最长存活时间（秒）
+        """
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries: OrderedDict[bytes, tuple[float, Principal]] = OrderedDict()
+        self._by_user: dict[str, set[bytes]] = {}
+        self._revoked: dict[bytes, float] = {}      # 被撤销的令牌摘要 -> 令牌 exp
+        self._revoked_expiry: list[tuple[float, bytes]] = []  # 按 exp 排序的小顶堆，用于删除已过期的撤销记录
+        self._not_before: dict[str, float] = {}     # 用户 -> 不晚于此时签发的令牌全部失效
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str, token_type: str) -> Optional[Principal]:
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1].token_type != token_type:
+                TOKEN_CACHE_REQUESTS.inc(result="miss")
+                return None
+            if entry[0] <= time.time():
+                self._remove(key)
+                TOKEN_CACHE_REQUESTS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+            TOKEN_CACHE_REQUESTS.inc(result="hit")
+            return entry[1]
+
+    def put(self, token: str, principal: Principal, exp: float):
+        """
+        :param exp: 令牌的过期时间（Unix 时间戳）
+        """
+        expires = min(exp, time.time() + self.max_ttl)
+        key = self.digest(token)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (expires, principal)
+            TOKEN_CACHE_ENTRIES.inc()
+            self._by_user.setdefault(principal.user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def is_revoked(self, token: str, user_id: str, issued_at: Optional[float]) -> bool:
+        """
+        签名验证通过的令牌是否已被撤销
+        :param issued_at: 令牌的 iat，旧令牌没有 iat 时视为很早签发；整秒的 iat 与撤销在同一秒时也视为已撤销
+        """
+        not_before = self._not_before.get(user_id)
+        if not_before is not None and (issued_at or 0) <= not_before:
+            return True
+        return self.digest(token) in self._revoked
+
+    def revoke_token(self, token: str, exp: float):
+        """
+        撤销单个令牌（注销时调用）
+        :param exp: 令牌的过期时间，此后撤销记录可以删除
+        """
+        key = self.digest(token)
+        now = time.time()
+        with self._lock:
+            self._remove(key)
+            # 只删除令牌已过期的记录，未过期的撤销记录一律保留
+            while self._revoked_expiry and self._revoked_expiry[0][0] <= now:
+                expired_exp, expired = heapq.heappop(self._revoked_expiry)
+                if self._revoked.get(expired) == expired_exp:
+                    del self._revoked[expired]
+            if exp > now and self._revoked.get(key) != exp:
+                self._revoked[key] = exp
+                heapq.heappush(self._revoked_expiry, (exp, key))
+            TOKEN_REVOCATIONS.set(len(self._revoked))
+
+    def revoke_user(self, user_id: str):
+        """
+        撤销该用户此前签发的所有令牌（修改密码时调用）
+        """
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+            self._not_before[user_id] = time.time()
+
+    def _remove(self, key: bytes):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        TOKEN_CACHE_ENTRIES.dec()
+        keys = self._by_user.get(entry[1].user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry[1].user_id]
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,59 +1,9 @@
 import inspect
 from typing import Callable, Any
-import shlex
 from typing import Tuple, Optional
 from utils.MessageTypes import *
 
 
-COMMAND_AS_ARG_COMMANDS = [
-    "/qrcode"
-]
-
-def parse_command(message: Message) -> Tuple[Optional[str], list[str]]:
-    try:
-        for segment in message:
-            if not isinstance(segment, TextMessageSegment):
-                continue
-
-            raw = segment.data.text.strip().lstrip('/')
-            if not raw:
-                continue
-
-            tokens = shlex.split(raw)
-            if not tokens:
-                return None, []
-            return f"/{tokens[0]}", tokens[1:]
-
-        return None, []
-    except ValueError:
-        # shlex.split 抛异常的情况（引号未闭合等）
-        return None, []
-
-def handle_command_as_arg_commands(command: str, content: str, arg_list: list[str]) -> list[str] :
-    if command in COMMAND_AS_ARG_COMMANDS:
-        return [content] + arg_list
-    return arg_list
-
-def parse_no_backslash_command(message: Message) -> Tuple[Optional[str], list[str]]:
-    try:
-        for segment in message:
-            if not isinstance(segment, TextMessageSegment):
-                continue
-
-            raw = segment.data.text.strip()
-            if not raw:
-                continue
-
-            tokens = shlex.split(raw)
-            if not tokens:
-                return None, []
-            return f"{tokens[0]}", tokens[1:]
-
-        return None, []
-    except ValueError:
-        # shlex.split 抛异常的情况（引号未闭合等）
-        return None, []
-
 class CommandArgError(ValueError):
     """参数绑定失败时抛出的异常"""
     pass
@@ -73,39 +23,63 @@ class MissingArgsError(CommandArgError):
 class CommandExcuteException(Exception):
     pass
 
-def bind_args(func: Callable, arg_list: list[str]) -> dict[str, Any]:
-    sig = inspect.signature(func)
-    params = list(sig.parameters.values())
-
-    # Ignore *args and **kwargs for binding positional args
-    positional_params = [p for p in params if p.kind in (
-        inspect.Parameter.POSITIONAL_ONLY,
-        inspect.Parameter.POSITIONAL_OR_KEYWORD
-    )]
-
-    if len(arg_list) > len(positional_params):
-        raise TooManyArgsError("Too many arguments")
-
-    args = {}
-
-    for i, arg in enumerate(arg_list):
-        param = positional_params[i]
-        name = param.name
-        ann = param.annotation
-
-        try:
-            value = arg if ann is inspect.Parameter.empty else ann(arg)
-        except Exception:
-            raise InvalidArgsValueError(f"Invalid value for `{name}`: {arg}")
-
-        args[name] = value
-
-    # Fill in defaults for remaining positional parameters
-    for param in positional_params[len(arg_list):]:
-        if param.default is inspect.Parameter.empty:
-            raise MissingArgsError(f"Missing argument: `{param.name}`")
-        args[param.name] = param.default
+class CommandBinder:
+    """
+    命令参数绑定器，在命令注册时根据函数签名构建一次，之后每条消息直接复用。
+    预先计算好每个位置参数的转换函数、默认值以及报错信息，绑定时不再调用 inspect.signature
+    """
+    __slots__ = ("func_name", "_converters", "_defaults", "_max_args")
+
+    def __init__(self, func: Callable):
+        self.func_name = func.__name__
+        params = inspect.signature(func).parameters.values()
+
+        # Ignore *args and **kwargs for binding positional args
+        positional_params = [p for p in params if p.kind in (
+            inspect.Parameter.POSITIONAL_ONLY,
+            inspect.Parameter.POSITIONAL_OR_KEYWORD
+        )]
+        # (参数名, 转换函数, 参数值非法时的报错前缀)
+        self._converters: tuple[tuple[str, Optional[Callable[[str], Any]], str], ...] = tuple(
+            (p.name, None if p.annotation is inspect.Parameter.empty else p.annotation, f"Invalid value for `{p.name}`: ")
+            for p in positional_params
+        )
+        # 第 i 项为只传入 i 个参数时需要补全的默认值；缺少必填参数时为报错信息
+        self._defaults: tuple[dict[str, Any] | str, ...] = tuple(
+            self._build_defaults(positional_params[count:]) for count in range(len(positional_params) + 1)
+        )
+        self._max_args = len(positional_params)
+
+    @staticmethod
+    def _build_defaults(rest: list[inspect.Parameter]) -> dict[str, Any] | str:
+        defaults = {}
+        for param in rest:
+            if param.default is inspect.Parameter.empty:
+                return f"Missing argument: `{param.name}`"
+            defaults[param.name] = param.default
+        return defaults
+
+    def bind(self, arg_list: list[str]) -> dict[str, Any]:
+        if len(arg_list) > self._max_args:
+            raise TooManyArgsError("Too many arguments")
+
+        args = {}
+        for (name, converter, error), arg in zip(self._converters, arg_list):
+            if converter is None:
+                args[name] = arg
+                continue
+            try:
+                args[name] = converter(arg)
+            except Exception:
+                raise InvalidArgsValueError(f"{error}{arg}")
 
-    return args
+        # Fill in defaults for remaining positional parameters
+        defaults = self._defaults[len(arg_list)]
+        if isinstance(defaults, str):
+            raise MissingArgsError(defaults)
+        args.update(defaults)
+        return args
 
 
+def bind_args(func: Callable, arg_list: list[str]) -> dict[str, Any]:
+    return CommandBinder(func).bind(arg_list)